@@ -0,0 +1,62 @@
+import logging
+from typing import Awaitable, Callable
+
+from app.cloud_services import firestore_db
+from app.config.settings import settings
+from app.utils.cache import LRUCache, SingleFlight
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# In-process tier in front of the copilot_cache Firestore collection
+_analysis_cache = LRUCache(
+    max_size=settings.COPILOT_CACHE_SIZE,
+    ttl_s=settings.COPILOT_CACHE_TTL_S,
+    name="copilot_analysis",
+)
+_analysis_flights = SingleFlight()
+
+
+def analysis_key(image_hash: str, version: str) -> str:
+    """Cache key (and Firestore document ID) for one image under one prompt/model version."""
+    return f"{image_hash}-{version}"
+
+
+async def _read_through(key: str, analyze: Callable[[], Awaitable[dict]]) -> dict:
+    try:
+        cached = await firestore_db.get_cached_analysis(key)
+    except Exception as e:
+        logger.warning(f"Could not read cached analysis {key}: {e}")
+        cached = None
+
+    if cached is not None:
+        metrics.incr("copilot.analysis.firestore_hits")
+    else:
+        metrics.incr("copilot.analysis.computed")
+        cached = await analyze()
+        if cached.get("parse_error"):
+            # Unparseable model output: worth retrying on the next upload
+            return cached
+        try:
+            await firestore_db.set_cached_analysis(key, cached)
+        except Exception as e:
+            logger.warning(f"Could not persist analysis {key}: {e}")
+
+    _analysis_cache.set(key, cached)
+    return cached
+
+
+async def get_or_analyze(image_hash: str, version: str, analyze: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    Returns the analysis for an image, checking the in-process LRU, then Firestore,
+    and only then calling analyze(). Concurrent requests for the same image (double
+    clicks, client retries) share one in-flight lookup and analysis.
+    """
+    key = analysis_key(image_hash, version)
+    cached = _analysis_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if key in _analysis_flights:
+        metrics.incr("copilot.analysis.coalesced")
+    return await _analysis_flights.do(key, lambda: _read_through(key, analyze))
@@ -0,0 +1,126 @@
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from google.cloud import firestore_v1 as firestore
+
+from app.cloud_services.firestore_db import db
+from app.config.settings import settings
+from app.utils.cache import LRUCache, SingleFlight
+from app.utils.price_utils import build_sketch, price_bucket, sketch_percentiles
+
+logger = logging.getLogger(__name__)
+
+# One document per category: {category, count, sum, sketch: {bucket: count}, updated_at}
+STATS_COLLECTION = "category_stats"
+
+_stats_cache = LRUCache(max_size=1024, ttl_s=settings.CATEGORY_STATS_TTL_S, name="category_stats")
+_rebuilds = SingleFlight()
+
+
+def stats_doc_id(category: str) -> str:
+    """Document ID of a category's aggregate; categories may contain '/' and other characters IDs cannot."""
+    return hashlib.sha256(category.encode("utf-8")).hexdigest()
+
+
+def stats_document(category: str, prices: list, updated_at: datetime) -> dict:
+    return {
+        "category": category,
+        "count": len(prices),
+        "sum": float(sum(prices)),
+        "sketch": build_sketch(prices),
+        "updated_at": updated_at,
+    }
+
+
+def _is_stale(data: dict) -> bool:
+    updated_at = data.get("updated_at")
+    if updated_at is None:
+        return True
+    return (datetime.now(timezone.utc) - updated_at).total_seconds() > settings.CATEGORY_STATS_MAX_AGE_S
+
+
+def _summarise(data: dict) -> dict:
+    count = data.get("count", 0)
+    return {
+        "count": count,
+        "sum": data.get("sum", 0.0),
+        "avg": data.get("sum", 0.0) / count if count else 0.0,
+        "percentiles": sketch_percentiles(data.get("sketch", {})),
+    }
+
+
+async def rebuild_category_stats(category: str) -> dict:
+    """Recomputes one category's aggregate from its products. O(category size); used for seeding."""
+    products_ref = (
+        db.collection('products')
+        .where(filter=firestore.FieldFilter('category', '==', category))
+        .select(['price'])
+    )
+    prices = [doc.to_dict().get('price', 0) async for doc in products_ref.stream() if doc.exists]
+
+    data = stats_document(category, prices, datetime.now(timezone.utc))
+    await db.collection(STATS_COLLECTION).document(stats_doc_id(category)).set(data)
+    _stats_cache.pop(category)
+    return data
+
+
+async def get_category_stats(category: str) -> dict:
+    """
+    Count, sum, average and approximate percentiles of a category's prices.
+    A single document read, served from the in-process cache for CATEGORY_STATS_TTL_S.
+    Missing aggregates, and ones older than CATEGORY_STATS_MAX_AGE_S, are rebuilt from
+    the category's products so new listings are counted.
+    """
+    cached = _stats_cache.get(category)
+    if cached is not None:
+        return cached
+
+    doc = await db.collection(STATS_COLLECTION).document(stats_doc_id(category)).get()
+    data = doc.to_dict() if doc.exists else None
+    if data is None or _is_stale(data):
+        logger.info(f"Aggregate for category '{category}' is {'missing' if data is None else 'stale'}. Rebuilding it from products.")
+        # Concurrent requests for the category share one rescan
+        data = await _rebuilds.do(category, lambda: rebuild_category_stats(category))
+
+    stats = _summarise(data)
+    _stats_cache.set(category, stats)
+    return stats
+
+
+def _delta(category: str, price: float, sign: int) -> dict:
+    return {
+        "category": category,
+        "count": firestore.Increment(sign),
+        "sum": firestore.Increment(sign * price),
+        "sketch": {str(price_bucket(price)): firestore.Increment(sign)},
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+async def record_product_write(before: Optional[dict], after: Optional[dict]):
+    """
+    Applies a product create/update/delete to the category aggregates with atomic
+    increments. Pass the product data before and after the write (None for a create or
+    a delete). Products are not written through this service today, so nothing calls it
+    yet; until a write path or trigger does, freshness comes from the max-age rebuild in
+    get_category_stats and scripts/rebuild_category_stats.py.
+    """
+    def key(data):
+        return (data.get('category'), data.get('price', 0)) if data else (None, None)
+
+    if key(before) == key(after):
+        return
+
+    batch = db.batch()
+    for data, sign in ((before, -1), (after, 1)):
+        if data and data.get('category'):
+            category = data['category']
+            batch.set(
+                db.collection(STATS_COLLECTION).document(stats_doc_id(category)),
+                _delta(category, data.get('price', 0), sign),
+                merge=True,
+            )
+            _stats_cache.pop(category)
+    await batch.commit()
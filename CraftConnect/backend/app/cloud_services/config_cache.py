@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from app.cloud_services.firestore_db import db, watch_document
+from app.config.settings import settings
+from app.utils.cache import SingleFlight
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry(NamedTuple):
+    value: dict
+    fetched_at: float
+
+
+class ConfigDocumentCache:
+    """
+    Stale-while-revalidate cache for small, rarely changing Firestore documents
+    (pricing rules and similar config).
+
+    - A cached copy is always returned immediately. Once it is older than ttl_s a
+      background refresh is started, and the next caller sees the new value.
+    - A snapshot listener (see watch) pushes edits into the cache as they happen.
+    - With no cached copy yet (a cold worker), callers await the shared first fetch
+      for up to fetch_timeout_s and get its error if it fails: there is no last known
+      good copy to fall back to, and made-up defaults would give wrong answers.
+      warm() does this fetch at startup so requests normally never wait on it.
+    """
+
+    def __init__(self, ttl_s: float, fetch_timeout_s: float):
+        self.ttl_s = ttl_s
+        self.fetch_timeout_s = fetch_timeout_s
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self._fetches = SingleFlight()
+        self._unsubscribes: List[Callable[[], None]] = []
+
+    async def _fetch(self, key: Tuple[str, str]) -> dict:
+        collection, doc_id = key
+        doc = await db.collection(collection).document(doc_id).get()
+        value = doc.to_dict() if doc.exists else {}
+        self._entries[key] = _Entry(value, time.monotonic())
+        metrics.incr("config_cache.refreshes")
+        return value
+
+    def _refresh_in_background(self, key: Tuple[str, str]):
+        if key in self._fetches:
+            return
+        task = self._fetches.start(key, lambda: self._fetch(key))
+
+        def _log_failure(done: asyncio.Task):
+            if not done.cancelled() and done.exception() is not None:
+                metrics.incr("config_cache.refresh_errors")
+                logger.warning(f"Background refresh of {key[0]}/{key[1]} failed, serving last known copy: {done.exception()}")
+        task.add_done_callback(_log_failure)
+
+    async def get(self, collection: str, doc_id: str) -> dict:
+        key = (collection, doc_id)
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            if time.monotonic() - entry.fetched_at > self.ttl_s:
+                metrics.incr("config_cache.stale_hits")
+                self._refresh_in_background(key)
+            else:
+                metrics.incr("config_cache.hits")
+            return entry.value
+
+        metrics.incr("config_cache.misses")
+        try:
+            return await asyncio.wait_for(self._fetches.do(key, lambda: self._fetch(key)), self.fetch_timeout_s)
+        except Exception as e:
+            # On a timeout the shared fetch keeps running and fills the cache for later callers
+            metrics.incr("config_cache.cold_errors")
+            logger.error(f"Could not load {collection}/{doc_id} ({e!r}) and no copy is cached yet.")
+            raise
+
+    async def warm(self, collection: str, doc_id: str):
+        """Loads a document before serving, so no request pays for (or fails on) the first fetch."""
+        try:
+            await self.get(collection, doc_id)
+        except Exception:
+            logger.warning(f"Could not warm {collection}/{doc_id}; the first request will retry the fetch.")
+
+    def watch(self, collection: str, doc_id: str):
+        """Keeps one document fresh through a Firestore snapshot listener."""
+        key = (collection, doc_id)
+
+        def on_change(data):
+            # Runs on the listener thread; replacing the entry is a single atomic assignment
+            self._entries[key] = _Entry(data or {}, time.monotonic())
+            metrics.incr("config_cache.listener_updates")
+
+        try:
+            self._unsubscribes.append(watch_document(collection, doc_id, on_change))
+        except Exception as e:
+            logger.warning(f"Could not start listener for {collection}/{doc_id}, relying on TTL refresh: {e}")
+
+    def stop(self):
+        for unsubscribe in self._unsubscribes:
+            unsubscribe()
+        self._unsubscribes.clear()
+
+
+# Singleton shared by every reader of config documents
+config_cache = ConfigDocumentCache(
+    ttl_s=settings.CONFIG_CACHE_TTL_S,
+    fetch_timeout_s=settings.CONFIG_CACHE_FETCH_TIMEOUT_S,
+)
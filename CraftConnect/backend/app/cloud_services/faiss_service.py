@@ -1,52 +1,178 @@
 import faiss
 import numpy as np
-import pickle
-from typing import List
+from typing import Dict, List, NamedTuple, Optional
+import asyncio
 import logging
 import os
+import threading
+from app.config.settings import settings
+from app.utils.faiss_utils import (
+    INDEX_FILE, IDS_FILE, META_FILE, VECTORS_FILE, IDS_SORTED_FILE, LABELS_SORTED_FILE, NEIGHBORS_FILE,
+    current_version, load_array, load_ids, lookup_label, mmap_mode, prepare_vectors, read_index, read_meta,
+    set_search_params,
+)
 
 logger = logging.getLogger(__name__)
 
+
+class IndexSnapshot(NamedTuple):
+    """One immutable, fully loaded index version. Searches hold on to a snapshot, so a swap never tears a query."""
+    version: str
+    index: faiss.Index
+    product_ids: np.ndarray
+    meta: dict
+    # Local vector store: product_id -> label -> raw embedding (None for versions built before it existed)
+    ids_sorted: Optional[np.ndarray] = None
+    labels_sorted: Optional[np.ndarray] = None
+    vectors: Optional[np.ndarray] = None
+    # Precomputed top-K neighbour labels per label (None when the table was not built)
+    neighbors: Optional[np.ndarray] = None
+
+
 class FaissIndex:
-    def __init__(self, index_path="index.faiss", mapping_path="mapping.pkl"):
-        self.index = None
-        self.product_id_map = []
+    def __init__(self, index_dir: str = settings.FAISS_INDEX_DIR, mmap: bool = settings.FAISS_MMAP):
+        self.index_dir = index_dir
+        self.mmap = mmap
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._reload_lock = threading.Lock()
         # Load the index immediately upon creation
-        self._load_index(index_path, mapping_path)
-
-    def _load_index(self, index_path: str, mapping_path: str):
         try:
-            # Check if files exist before trying to load
-            if not os.path.exists(index_path) or not os.path.exists(mapping_path):
-                raise FileNotFoundError(f"Index files not found. Ensure '{index_path}' and '{mapping_path}' exist.")
-
-            self.index = faiss.read_index(index_path)
-            with open(mapping_path, "rb") as f:
-                self.product_id_map = pickle.load(f)
-            
-            if self.index.ntotal == 0:
-                raise ValueError("FAISS index is empty. Please re-run the indexing script.")
-            
-            logger.info(f"✅ FAISS index loaded successfully. {self.index.ntotal} vectors indexed.")
-
+            self.reload()
+            if self._snapshot is None:
+                raise FileNotFoundError(
+                    f"No published index found in '{index_dir}'. Please run scripts/index_products.py."
+                )
         except (FileNotFoundError, ValueError) as e:
             logger.error(f"❌ Critical error loading FAISS index: {e}")
             # In a real app, you might want to handle this more gracefully,
             # but for the hackathon, crashing on startup is better than failing silently.
             raise e
 
+    @property
+    def version(self) -> Optional[str]:
+        return self._snapshot.version if self._snapshot else None
+
+    def _load_version(self, version: str) -> IndexSnapshot:
+        version_dir = os.path.join(self.index_dir, version)
+        index_path = os.path.join(version_dir, INDEX_FILE)
+        ids_path = os.path.join(version_dir, IDS_FILE)
+        if not os.path.exists(index_path) or not os.path.exists(ids_path):
+            raise FileNotFoundError(f"Index files not found. Ensure '{index_path}' and '{ids_path}' exist.")
+
+        meta = read_meta(os.path.join(version_dir, META_FILE))
+        index = read_index(index_path, mmap=self.mmap, factory=meta.get("factory", "Flat"))
+        if index.ntotal == 0:
+            raise ValueError("FAISS index is empty. Please re-run the indexing script.")
+
+        set_search_params(index, nprobe=settings.FAISS_NPROBE, ef_search=settings.FAISS_EF_SEARCH)
+        product_ids = load_ids(ids_path, mmap=self.mmap)
+        ids_sorted = load_array(os.path.join(version_dir, IDS_SORTED_FILE), mmap=self.mmap)
+        labels_sorted = load_array(os.path.join(version_dir, LABELS_SORTED_FILE), mmap=self.mmap)
+        vectors = load_array(os.path.join(version_dir, VECTORS_FILE), mmap=self.mmap)
+        neighbors = load_array(os.path.join(version_dir, NEIGHBORS_FILE), mmap=self.mmap)
+
+        logger.info(
+            f"✅ FAISS index {version} loaded successfully. {index.ntotal} vectors indexed "
+            f"({meta.get('factory')}, {meta.get('metric')}, "
+            f"mmap={mmap_mode(meta.get('factory', 'Flat')) if self.mmap else 'off'})."
+        )
+        return IndexSnapshot(version, index, product_ids, meta, ids_sorted, labels_sorted, vectors, neighbors)
+
+    def reload(self) -> bool:
+        """
+        Loads the published version if it differs from the one being served and swaps it in.
+        The new version is fully loaded before the swap; in-flight searches finish on the old one.
+        Returns True when a new version was swapped in.
+        """
+        with self._reload_lock:
+            version = current_version(self.index_dir)
+            if version is None or (self._snapshot and self._snapshot.version == version):
+                return False
+
+            snapshot = self._load_version(version)
+            previous = self.version
+            self._snapshot = snapshot  # single reference assignment, atomic for readers
+            if previous:
+                logger.info(f"Swapped FAISS index {previous} -> {version}.")
+            return True
+
+    async def watch(self, interval_s: float = settings.FAISS_RELOAD_INTERVAL_S):
+        """Polls for newly published versions and hot-swaps them. Run as a background task."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await loop.run_in_executor(None, self.reload)
+            except Exception as e:
+                # Keep serving the current version if the new one is broken
+                logger.error(f"Failed to hot-reload FAISS index: {e}", exc_info=True)
+
+    def label_of(self, product_id: str, snapshot: Optional[IndexSnapshot] = None) -> int:
+        """FAISS label of a product in the served version, or -1 if it is not indexed."""
+        snapshot = snapshot or self._snapshot
+        if snapshot is None or snapshot.ids_sorted is None:
+            return -1
+        return lookup_label(snapshot.ids_sorted, snapshot.labels_sorted, product_id)
+
+    def get_vectors(self, product_ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Source embeddings straight from the memory-mapped vector store, without a Firestore
+        round trip. Products missing from the served version are left out of the result.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.vectors is None:
+            return {}
+        found = {}
+        for product_id in product_ids:
+            label = self.label_of(product_id, snapshot)
+            if 0 <= label < len(snapshot.vectors):
+                found[product_id] = np.array(snapshot.vectors[label])
+        return found
+
+    def get_vector(self, product_id: str) -> Optional[np.ndarray]:
+        return self.get_vectors([product_id]).get(product_id)
+
+    def precomputed_neighbors(self, product_id: str, k: int) -> Optional[List[str]]:
+        """
+        Up to k most similar product IDs from the precomputed table, an O(1) memory lookup.
+        Returns None when the product is newer than the table, so callers fall back to a live search.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.neighbors is None:
+            return None
+        label = self.label_of(product_id, snapshot)
+        if not 0 <= label < len(snapshot.neighbors):
+            return None
+        return self._labels_to_ids(snapshot, snapshot.neighbors[label])[:k]
+
     def search(self, query_embedding: np.ndarray, k: int) -> List[str]:
-        if not self.index:
+        results = self.search_batch(query_embedding.reshape(1, -1), k)
+        return results[0] if results else []
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int) -> List[List[str]]:
+        """Runs a single vectorised FAISS search for a (n_queries, dim) matrix of embeddings."""
+        snapshot = self._snapshot
+        if snapshot is None:
             logger.warning("Search called but FAISS index is not available.")
             return []
-        
-        # --- Debug Prints to be sure ---
-        print(f"DEBUG: Index has {self.index.ntotal} vectors.")
-        print(f"DEBUG: Query embedding shape: {query_embedding.shape}")
-        # --------------------------------
 
-        distances, indices = self.index.search(query_embedding.astype('float32').reshape(1, -1), k)
-        return [self.product_id_map[i] for i in indices[0] if i < len(self.product_id_map)]
+        logger.debug(f"Searching {snapshot.index.ntotal} vectors with queries of shape {query_embeddings.shape}.")
+
+        queries = prepare_vectors(query_embeddings, snapshot.meta.get("metric", "l2"))
+        distances, indices = snapshot.index.search(queries, k)
+        return [self._labels_to_ids(snapshot, row) for row in indices]
+
+    @staticmethod
+    def _labels_to_ids(snapshot: IndexSnapshot, labels) -> List[str]:
+        ids = []
+        num_ids = len(snapshot.product_ids)
+        for label in labels:
+            # IVF and HNSW pad with -1 when fewer than k neighbours are reachable
+            if 0 <= label < num_ids:
+                product_id = snapshot.product_ids[label]
+                if product_id:  # empty entries are labels freed by incremental deletes
+                    ids.append(product_id.decode("utf-8"))
+        return ids
 
 # This line now creates the instance AND loads the index immediately.
-faiss_index = FaissIndex()
\ No newline at end of file
+faiss_index = FaissIndex()
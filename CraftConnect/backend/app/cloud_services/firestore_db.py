@@ -2,7 +2,8 @@ from google.cloud.firestore_v1.async_client import AsyncClient
 from app.config.settings import settings
 
 import logging                             # for transation glossary   
-from google.cloud.firestore_v1 import AsyncClient
+from typing import Callable, Optional
+from google.cloud.firestore_v1 import AsyncClient, Client
 
 
 db = AsyncClient(project=settings.PROJECT_ID, database=settings.FIRESTORE_DB)
@@ -11,6 +12,51 @@ logger = logging.getLogger(__name__)              # for transation glossary
 
 CACHE_COLLECTION = "copilot_cache"
 
+# Snapshot listeners only exist on the synchronous client; created on first use
+_listener_client: Optional[Client] = None
+
+
+def watch_document(collection: str, doc_id: str, callback: Callable[[Optional[dict]], None]) -> Callable[[], None]:
+    """
+    Calls callback(data) on a background thread whenever the document changes
+    (data is None once it is deleted). Returns a function that stops the listener.
+    """
+    global _listener_client
+    if _listener_client is None:
+        _listener_client = Client(project=settings.PROJECT_ID, database=settings.FIRESTORE_DB)
+
+    def on_snapshot(doc_snapshots, changes, read_time):
+        for snapshot in doc_snapshots:
+            callback(snapshot.to_dict() if snapshot.exists else None)
+
+    watch = _listener_client.collection(collection).document(doc_id).on_snapshot(on_snapshot)
+    return watch.unsubscribe
+
+
+def watch_collection(collection: str, callback: Callable[[str, Optional[dict]], None]) -> Callable[[], None]:
+    """
+    Calls callback(doc_id, data) on a background thread for every document that is
+    added, modified or removed (data is None once removed) after the listener starts.
+    Returns a function that stops the listener.
+    """
+    global _listener_client
+    if _listener_client is None:
+        _listener_client = Client(project=settings.PROJECT_ID, database=settings.FIRESTORE_DB)
+
+    initial_snapshot = [True]
+
+    def on_snapshot(col_snapshot, changes, read_time):
+        # The first snapshot lists every existing document; only later changes matter
+        if initial_snapshot[0]:
+            initial_snapshot[0] = False
+            return
+        for change in changes:
+            removed = change.type.name == "REMOVED"
+            callback(change.document.id, None if removed else change.document.to_dict())
+
+    watch = _listener_client.collection(collection).on_snapshot(on_snapshot)
+    return watch.unsubscribe
+
 async def set_cached_analysis(image_hash: str, data: dict):
     """Saves analysis data to Firestore."""
     doc_ref = db.collection(CACHE_COLLECTION).document(image_hash)
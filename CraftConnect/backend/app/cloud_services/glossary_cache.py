@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+from app.cloud_services.firestore_db import db, watch_collection
+from app.config.settings import settings
+from app.utils.cache import LRUCache, SingleFlight
+from app.utils.metrics import metrics
+from app.utils.text_utils import glossary_version
+
+logger = logging.getLogger(__name__)
+
+ARTISANS_COLLECTION = "artisans"
+
+
+class GlossaryCache:
+    """
+    In-process cache of artisan glossaries, keyed by (artisan_id, language_code) and
+    holding (glossary, version). Bounded and TTL'd; a snapshot listener on the artisans
+    collection (see watch) drops an artisan's entries as soon as their document changes.
+    Concurrent misses for the same key share one Firestore read.
+    """
+
+    def __init__(self, max_size: int, ttl_s: float):
+        self._cache = LRUCache(max_size=max_size, ttl_s=ttl_s, name="glossaries")
+        self._fetches = SingleFlight()
+        self._languages: Dict[str, set] = {}
+        # Bumped on every invalidation so a fetch that raced with an edit is not cached
+        self._generations: Dict[str, int] = {}
+        self._unsubscribe: Optional[Callable[[], None]] = None
+
+    async def _fetch(self, artisan_id: str, language_code: str) -> Tuple[dict, str]:
+        generation = self._generations.get(artisan_id, 0)
+        field = f"glossary_{language_code}"
+        # Only the one glossary field is read, not the whole artisan document
+        doc = await db.collection(ARTISANS_COLLECTION).document(artisan_id).get(field_paths=[field])
+        if doc.exists:
+            glossary = (doc.to_dict() or {}).get(field, {})
+        else:
+            logger.warning(f"No document found for artisan_id: {artisan_id}")
+            glossary = {}
+        entry = (glossary, glossary_version(glossary))
+
+        metrics.incr("glossary_cache.fetches")
+        if self._generations.get(artisan_id, 0) == generation:
+            self._cache.set((artisan_id, language_code), entry)
+            self._languages.setdefault(artisan_id, set()).add(language_code)
+        return entry
+
+    async def get(self, artisan_id: str, language_code: str) -> Tuple[dict, str]:
+        """Returns (glossary, version) for an artisan and language; an empty glossary if there is none."""
+        key = (artisan_id, language_code)
+        entry = self._cache.get(key)
+        if entry is not None:
+            return entry
+        try:
+            return await self._fetches.do(key, lambda: self._fetch(artisan_id, language_code))
+        except Exception as e:
+            # Translate without the glossary rather than failing the request; nothing is cached
+            logger.error(f"Error fetching glossary for artisan {artisan_id}: {e}", exc_info=True)
+            return {}, None
+
+    def invalidate(self, artisan_id: str):
+        """Drops an artisan's cached glossaries. Call on the event loop, like get()."""
+        self._generations[artisan_id] = self._generations.get(artisan_id, 0) + 1
+        for language_code in self._languages.pop(artisan_id, ()):
+            self._cache.pop((artisan_id, language_code))
+        metrics.incr("glossary_cache.invalidations")
+
+    def watch(self):
+        """
+        Invalidates an artisan's cached glossaries whenever their document is edited.
+        Call from the event loop (the app's lifespan), which does the invalidation.
+        """
+        loop = asyncio.get_running_loop()
+
+        def on_change(doc_id: str, data: Optional[dict]):
+            # Runs on the listener thread: hand over to the loop so the cache state is only
+            # ever touched there, never between _fetch's generation check and its set
+            try:
+                loop.call_soon_threadsafe(self.invalidate, doc_id)
+            except RuntimeError:
+                pass  # loop already closed during shutdown
+
+        try:
+            self._unsubscribe = watch_collection(ARTISANS_COLLECTION, on_change)
+        except Exception as e:
+            logger.warning(f"Could not start the glossary listener, relying on TTL expiry: {e}")
+
+    def stop(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+
+
+# Singleton shared by every translation request
+glossary_cache = GlossaryCache(
+    max_size=settings.GLOSSARY_CACHE_SIZE,
+    ttl_s=settings.GLOSSARY_CACHE_TTL_S,
+)
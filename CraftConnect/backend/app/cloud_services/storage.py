@@ -1,10 +1,12 @@
 from google.cloud import storage as gcs
 from app.config.settings import settings
+from typing import BinaryIO
 import asyncio
+import functools
 
 storage_client = gcs.Client(project=settings.PROJECT_ID)
 
-async def upload_file_async(file_content: bytes, destination_blob_name: str) -> str:
+async def upload_file_async(file_content: bytes, destination_blob_name: str, content_type: str = 'image/jpeg') -> str:
     """Uploads a file to the bucket and returns its GCS URI."""
     try:
         bucket = storage_client.bucket(settings.BUCKET_NAME)
@@ -16,10 +18,31 @@ async def upload_file_async(file_content: bytes, destination_blob_name: str) ->
             None,
             blob.upload_from_string,
             file_content,
-            'image/jpeg'
+            content_type
         )
 
         return f"gs://{settings.BUCKET_NAME}/{destination_blob_name}"
     except Exception as e:
         print(f"Error uploading to GCS: {e}")
-        return None
\ No newline at end of file
+        return None
+
+async def upload_stream_async(file_obj: BinaryIO, destination_blob_name: str, content_type: str, size: int) -> str:
+    """
+    Uploads from a file object with a chunked resumable upload, so only one
+    GCS_UPLOAD_CHUNK_BYTES chunk is in memory at a time. Returns the GCS URI.
+    """
+    try:
+        bucket = storage_client.bucket(settings.BUCKET_NAME)
+        # Setting chunk_size makes the client use a resumable upload
+        blob = bucket.blob(destination_blob_name, chunk_size=settings.GCS_UPLOAD_CHUNK_BYTES)
+
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            None,
+            functools.partial(blob.upload_from_file, file_obj, rewind=True, size=size, content_type=content_type)
+        )
+
+        return f"gs://{settings.BUCKET_NAME}/{destination_blob_name}"
+    except Exception as e:
+        print(f"Error uploading to GCS: {e}")
+        return None
@@ -1,38 +1,58 @@
 from google.cloud import vision_v1
+from typing import List, Union
+from app.config.settings import settings
+from app.utils.batching import MicroBatcher
+from app.utils.metrics import metrics
+from app.utils.scheduler import slot
 
 # Use an async client
 client = vision_v1.ImageAnnotatorAsyncClient()
 
-async def analyze_image_from_gcs(gcs_uri: str) -> dict:
-    """Analyzes an image in GCS using the Vision API."""
-    image = vision_v1.Image()
-    image.source.image_uri = gcs_uri
-
-    features = [
-        vision_v1.Feature(type_=vision_v1.Feature.Type.LABEL_DETECTION, max_results=10),
-        vision_v1.Feature(type_=vision_v1.Feature.Type.IMAGE_PROPERTIES), # For dominant colors
-    ]
+FEATURES = [
+    vision_v1.Feature(type_=vision_v1.Feature.Type.LABEL_DETECTION, max_results=10),
+    vision_v1.Feature(type_=vision_v1.Feature.Type.IMAGE_PROPERTIES), # For dominant colors
+]
 
-    # Build a single request object
-    request = vision_v1.AnnotateImageRequest(image=image, features=features)
 
-    # --- THE FIX: Use the batch method, which is more robust ---
-    # We pass a list containing our single request.
-    response = await client.batch_annotate_images(requests=[request])
+def _parse_response(result: vision_v1.AnnotateImageResponse) -> Union[dict, Exception]:
+    if result.error.message:
+        return Exception(f"Vision API Error: {result.error.message}")
 
-    # The result is a list of responses, so we take the first one.
-    first_result = response.responses[0]
+    labels = [label.description for label in result.label_annotations]
 
-    if first_result.error.message:
-        raise Exception(f"Vision API Error: {first_result.error.message}")
-
-    # --- Parse the results from the 'first_result' object ---
-    labels = [label.description for label in first_result.label_annotations]
-
-    colors_info = first_result.image_properties_annotation.dominant_colors.colors
+    colors_info = result.image_properties_annotation.dominant_colors.colors
     colors = [
         {"red": int(color.color.red), "green": int(color.color.green), "blue": int(color.color.blue), "score": color.score}
         for color in colors_info
     ]
 
-    return {"labels": labels, "colors": sorted(colors, key=lambda c: c['score'], reverse=True)}
\ No newline at end of file
+    return {"labels": labels, "colors": sorted(colors, key=lambda c: c['score'], reverse=True)}
+
+
+async def _annotate_batch(gcs_uris: List[str]) -> List[Union[dict, Exception]]:
+    """One batch_annotate_images call for many images; per-image errors go back to their own caller."""
+    requests = []
+    for gcs_uri in gcs_uris:
+        image = vision_v1.Image()
+        image.source.image_uri = gcs_uri
+        requests.append(vision_v1.AnnotateImageRequest(image=image, features=FEATURES))
+
+    metrics.observe("vision.batch_size", len(requests))
+    async with slot("vision"):
+        response = await client.batch_annotate_images(requests=requests)
+    # Responses come back in request order
+    return [_parse_response(result) for result in response.responses]
+
+
+# Concurrent callers share one batch_annotate_images RPC per batch window
+_batcher = MicroBatcher(
+    _annotate_batch,
+    max_batch_size=settings.VISION_MAX_BATCH,
+    max_wait_ms=settings.VISION_BATCH_WINDOW_MS,
+    max_concurrent_batches=settings.VISION_MAX_CONCURRENCY,
+)
+
+
+async def analyze_image_from_gcs(gcs_uri: str) -> dict:
+    """Analyzes an image in GCS using the Vision API."""
+    return await _batcher.submit(gcs_uri)
@@ -1,6 +1,6 @@
 import os
 import pathlib
-from typing import Optional
+from typing import List, Optional
      
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -20,6 +20,114 @@ class Settings(BaseSettings):
     BUCKET_NAME: str
     FIRESTORE_EMULATOR_HOST: Optional[str] = None
 
+    # FAISS similarity index ("flat", "ivf_flat", "ivf_pq" or "hnsw")
+    FAISS_INDEX_TYPE: str = "flat"
+    FAISS_METRIC: str = "cosine"            # "l2", "ip" or "cosine"
+    FAISS_NLIST: int = 0                    # IVF cells, 0 = derive from catalogue size
+    FAISS_PQ_M: int = 64                    # PQ sub-quantizers, must divide the dimension
+    FAISS_PQ_NBITS: int = 8
+    FAISS_HNSW_M: int = 32
+    FAISS_HNSW_EF_CONSTRUCTION: int = 200
+    FAISS_NPROBE: int = 16                  # query-time, IVF cells visited
+    FAISS_EF_SEARCH: int = 64               # query-time, HNSW candidate list size
+    FAISS_INDEX_DIR: str = "faiss_indexes"  # versioned index root written by scripts/index_products.py
+    FAISS_MMAP: bool = True
+    FAISS_RELOAD_INTERVAL_S: float = 30.0   # how often workers check for a newly published version
+    FAISS_KEEP_VERSIONS: int = 3
+    NEIGHBOR_TABLE_K: int = 20              # precomputed neighbours per product, 0 disables the table
+    NEIGHBOR_TABLE_BATCH: int = 4096        # query rows per FAISS call while building the table
+
+    # Embedding micro-batching: concurrent get_embedding calls are merged into one request
+    # of up to EMBEDDING_MAX_BATCH texts (text-embedding-004 accepts 250 texts / 20k tokens)
+    EMBEDDING_MAX_BATCH: int = 100
+    EMBEDDING_MAX_BATCH_TOKENS: int = 18000  # by a conservative estimate, see embeddings.estimated_tokens
+    EMBEDDING_BATCH_WINDOW_MS: float = 10.0
+    EMBEDDING_MAX_CONCURRENCY: int = 4
+    # Embedding cache: in-memory LRU in front of an on-disk SQLite store ("" disables the disk tier)
+    EMBEDDING_CACHE_SIZE: int = 10000
+    EMBEDDING_CACHE_PATH: str = "cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_MAX_ROWS: int = 200000       # ~3 KB per vector; 0 = unbounded
+    EMBEDDING_CACHE_MAX_AGE_S: float = 30 * 24 * 3600
+
+    # Vision micro-batching: concurrent analyses share one batch_annotate_images call
+    # (the synchronous batch endpoint accepts at most 16 images per call)
+    VISION_MAX_BATCH: int = 16
+    VISION_BATCH_WINDOW_MS: float = 5.0
+    VISION_MAX_CONCURRENCY: int = 4
+
+    # Pricing: per-category aggregates are cached in-process for this long
+    CATEGORY_STATS_TTL_S: float = 300.0
+    # Aggregates older than this are rebuilt from products on read; scripts/rebuild_category_stats.py
+    # refreshes all of them at once (run it at least this often to keep requests off the rebuild path)
+    CATEGORY_STATS_MAX_AGE_S: float = 3600.0
+    PRICE_EXPLANATION_CACHE_SIZE: int = 5000
+    PRICE_EXPLANATION_CACHE_TTL_S: float = 24 * 3600
+    PRICING_BATCH_CONCURRENCY: int = 8      # concurrent Gemini explanations per bulk request
+
+    # Uploads are read in chunks, kept in memory up to the spool threshold and streamed to GCS
+    UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_READ_CHUNK_BYTES: int = 256 * 1024
+    UPLOAD_SPOOL_THRESHOLD_BYTES: int = 1024 * 1024
+    GCS_UPLOAD_CHUNK_BYTES: int = 8 * 256 * 1024  # resumable upload chunk, must be a multiple of 256 KB
+
+    # Image normalisation before upload/analysis (process pool, WebP output)
+    IMAGE_MAX_EDGE: int = 1600
+    IMAGE_WEBP_QUALITY: int = 85
+    IMAGE_THUMBNAIL_EDGES: List[int] = [512, 256]
+    IMAGE_PROCESS_WORKERS: int = 2
+
+    # Copilot image analyses: in-process LRU in front of the copilot_cache collection
+    COPILOT_CACHE_SIZE: int = 1000
+    COPILOT_CACHE_TTL_S: float = 3600.0
+    COPILOT_BATCH_MAX_IMAGES: int = 10
+    COPILOT_BATCH_CONCURRENCY: int = 4      # photos uploaded and analysed at once per batch request
+
+    # Translation requests pack several texts; the API caps contents and total size per call
+    TRANSLATION_MAX_CONTENTS: int = 128
+    TRANSLATION_MAX_CODEPOINTS: int = 30000
+    TRANSLATION_MODEL_ID: str = "general/nmt"  # pinned so translation memory entries match the model
+    # Translation memory: in-memory LRU in front of an on-disk SQLite store ("" disables the disk tier)
+    TRANSLATION_MEMORY_SIZE: int = 20000
+    TRANSLATION_MEMORY_PATH: str = "cache/translations.sqlite3"
+    TRANSLATION_MEMORY_MAX_ROWS: int = 500000    # 0 = unbounded
+    TRANSLATION_MEMORY_MAX_AGE_S: float = 90 * 24 * 3600
+
+    # Artisan glossaries: cached per (artisan, language), invalidated by a listener on artisans
+    GLOSSARY_CACHE_SIZE: int = 2000
+    GLOSSARY_CACHE_TTL_S: float = 600.0
+    GLOSSARY_CACHE_LISTEN: bool = True
+
+    # Gemini text responses: exact-match cache, plus a semantic tier for callers that opt in
+    RESPONSE_CACHE_SIZE: int = 2000
+    RESPONSE_CACHE_TTL_S: float = 24 * 3600
+    SEMANTIC_CACHE_SIZE: int = 2000
+    SEMANTIC_CACHE_THRESHOLD: float = 0.97  # cosine similarity of prompt embeddings, 0 disables the tier
+    # Opt-in: even within one artisan, a near match can return a story with a since-corrected fact
+    STORY_SEMANTIC_CACHE: bool = False
+
+    # Vertex AI admission control: per-backend token bucket (requests/s, burst) and concurrency.
+    # Interactive calls that would wait longer than their budget are rejected with 429.
+    SCHEDULER_INTERACTIVE_BUDGET_S: float = 10.0
+    SCHEDULER_BATCH_BUDGET_S: float = 120.0     # bulk endpoints; offline scripts wait indefinitely
+    SCHEDULER_THROTTLE_PAUSE_S: float = 2.0     # admission pause after the backend returns 429
+    QUOTA_GEMINI_RPS: float = 5.0
+    QUOTA_GEMINI_BURST: float = 10
+    QUOTA_GEMINI_CONCURRENCY: int = 8
+    QUOTA_EMBEDDINGS_RPS: float = 10.0
+    QUOTA_EMBEDDINGS_BURST: float = 20
+    QUOTA_EMBEDDINGS_CONCURRENCY: int = 4
+    QUOTA_TRANSLATION_RPS: float = 10.0
+    QUOTA_TRANSLATION_BURST: float = 20
+    QUOTA_TRANSLATION_CONCURRENCY: int = 8
+    QUOTA_VISION_RPS: float = 10.0
+    QUOTA_VISION_BURST: float = 10
+    QUOTA_VISION_CONCURRENCY: int = 4
+
+    # Config documents (e.g. pricing_rules/default): served stale-while-revalidate
+    CONFIG_CACHE_TTL_S: float = 60.0
+    CONFIG_CACHE_FETCH_TIMEOUT_S: float = 10.0  # first fetch only; covers gRPC channel setup and auth
+    CONFIG_CACHE_LISTEN: bool = True        # push edits through Firestore snapshot listeners
+
     model_config = SettingsConfigDict(
         env_file=ENV_FILE_PATH,
         env_file_encoding='utf-8',
@@ -1,10 +1,18 @@
 import os
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 import vertexai
 from contextlib import asynccontextmanager
 from app.config.settings import settings
                      # ------  feature import ------ 
 from app.routes import storyteller, translation, copilot, pricing, recommender
+from app.cloud_services.faiss_service import faiss_index
+from app.cloud_services.config_cache import config_cache
+from app.cloud_services.glossary_cache import glossary_cache
+from app.utils.metrics import metrics
+from app.utils import image_utils
+from app.utils.scheduler import QuotaExceeded
 
 # ------------------------------------------------------------------
 
@@ -12,10 +20,27 @@ os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = settings.GOOGLE_APPLICATION_CREDE
 
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    image_utils.start_process_pool()
+    # Pick up freshly published FAISS index versions without restarting workers
+    index_watcher = asyncio.create_task(faiss_index.watch())
+    await config_cache.warm('pricing_rules', 'default')
+    if settings.CONFIG_CACHE_LISTEN:
+        config_cache.watch('pricing_rules', 'default')
+    if settings.GLOSSARY_CACHE_LISTEN:
+        glossary_cache.watch()
+    yield
+    index_watcher.cancel()
+    config_cache.stop()
+    glossary_cache.stop()
+    image_utils.shutdown_process_pool()
+
 
 app = FastAPI(
     title="CraftConnect AI API",
-    description="The backend service for the CraftConnect marketplace."
+    description="The backend service for the CraftConnect marketplace.",
+    lifespan=lifespan
 )
 
 vertexai.init(project=settings.PROJECT_ID, location=settings.REGION)
@@ -27,6 +52,22 @@ app.include_router(pricing.router, prefix="/pricing")               # pricing ro
 app.include_router(recommender.router, prefix="/recs", tags=["Recommendations"])     # recommender router
 
 
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded):
+    # Shed load early instead of letting requests queue behind an exhausted quota
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after_s)))},
+    )
+
+
 @app.get("/")
 def read_root():
-    return {"message": "CraftConnect API is running"}
\ No newline at end of file
+    return {"message": "CraftConnect API is running"}
+
+
+@app.get("/metrics", tags=["Ops"])
+def read_metrics():
+    """In-process counters, gauges and latency summaries (cache hit rates, queue depths...)."""
+    return metrics.snapshot()
\ No newline at end of file
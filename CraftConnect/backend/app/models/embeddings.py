@@ -1,26 +1,127 @@
+import asyncio
 import logging
 import numpy as np
-from typing import List
+from typing import Dict, List, Optional
 import vertexai
 from vertexai.language_models import TextEmbeddingModel
 from app.config.settings import settings
+from app.utils.batching import MicroBatcher
+from app.utils.cache import LRUCache, SqliteStore
+from app.utils.metrics import metrics
+from app.utils.scheduler import slot
+from app.utils.text_utils import text_hash
 
 logger = logging.getLogger(__name__)
 
+
+def estimated_tokens(text: str) -> int:
+    """
+    Upper-bound token estimate for the per-request limit: UTF-8 bytes / 3 is about one
+    token per character for Indic scripts and over-counts Latin text (~4 chars a token).
+    """
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model ID, normalised text hash).
+    A bounded in-memory LRU sits in front of an optional SQLite file that survives
+    restarts. Vectors are kept as float32 and stored on disk as raw float32 blobs.
+    """
+
+    def __init__(self, model_name: str, max_size: int, path: Optional[str] = None):
+        self.model_name = model_name
+        self.memory = LRUCache(max_size=max_size, name="embeddings")
+        self.disk = SqliteStore(
+            path, table="embeddings",
+            max_rows=settings.EMBEDDING_CACHE_MAX_ROWS, max_age_s=settings.EMBEDDING_CACHE_MAX_AGE_S,
+        ) if path else None
+
+    def key(self, text: str) -> str:
+        return f"{self.model_name}:{text_hash(text)}"
+
+    async def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[key] = vector
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.disk is not None:
+            loop = asyncio.get_running_loop()
+            rows = await loop.run_in_executor(None, self.disk.get_many, missing)
+            for key, blob in rows.items():
+                vector = np.frombuffer(blob, dtype=np.float32)
+                self.memory.set(key, vector)
+                found[key] = vector
+            metrics.incr("embedding_cache.disk_hits", len(rows))
+
+        metrics.incr("embedding_cache.hits", len(found))
+        metrics.incr("embedding_cache.misses", len(keys) - len(found))
+        return found
+
+    async def set_many(self, vectors: Dict[str, np.ndarray]):
+        for key, vector in vectors.items():
+            self.memory.set(key, vector)
+        if self.disk is not None and vectors:
+            loop = asyncio.get_running_loop()
+            blobs = {key: vector.tobytes() for key, vector in vectors.items()}
+            await loop.run_in_executor(None, self.disk.set_many, blobs)
+
+
 class VertexEmbeddings:
     def __init__(self, model_name: str = settings.EMBEDDING_MODEL_ID):
         # ✅ Initialize Vertex AI in embeddings region only
         vertexai.init(project=settings.PROJECT_ID, location=settings.EMBEDDING_REGION)
         self.model = TextEmbeddingModel.from_pretrained(model_name)
+        self.cache = EmbeddingCache(
+            model_name,
+            max_size=settings.EMBEDDING_CACHE_SIZE,
+            path=settings.EMBEDDING_CACHE_PATH or None,
+        )
+        # Concurrent callers share one get_embeddings request per batch window
+        self._batcher = MicroBatcher(
+            self._embed_batch,
+            max_batch_size=settings.EMBEDDING_MAX_BATCH,
+            max_wait_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+            max_concurrent_batches=settings.EMBEDDING_MAX_CONCURRENCY,
+            max_batch_weight=settings.EMBEDDING_MAX_BATCH_TOKENS,
+            weight=estimated_tokens,
+        )
         logger.info(f"Initialized Vertex AI Embedding model: {model_name}")
 
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Runs one blocking SDK request for a batch of texts in the thread pool."""
+        loop = asyncio.get_running_loop()
+        async with slot("embeddings"):
+            embeddings = await loop.run_in_executor(None, self.model.get_embeddings, texts)
+        return [embedding.values for embedding in embeddings]
+
     async def get_embedding(self, text: str) -> List[float]:
         """
         Generate embeddings for input text.
         """
-        # ✅ New API expects dict input with content + task_type
-        embeddings = self.model.get_embeddings([text])
-        return embeddings[0].values
+        embeddings = await self.get_embeddings([text])
+        return embeddings[0]
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for many texts. Cached texts are served locally; the rest
+        are split into as few requests as the batch limit allows.
+        """
+        keys = [self.cache.key(text) for text in texts]
+        vectors = await self.cache.get_many(keys)
+
+        # Embed each distinct missing text once
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            embedded = await asyncio.gather(*(self._batcher.submit(text) for text in missing.values()))
+            fresh = {key: np.asarray(values, dtype=np.float32) for key, values in zip(missing, embedded)}
+            await self.cache.set_many(fresh)
+            vectors.update(fresh)
+
+        return [vectors[key].tolist() for key in keys]
 
     def get_cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """
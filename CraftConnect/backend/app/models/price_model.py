@@ -1,27 +1,40 @@
+import asyncio
 import logging
 import math
-from app.cloud_services.firestore_db import db
-from google.cloud import firestore_v1 as firestore
+import numpy as np
+from typing import AsyncIterator, Dict, List
+from app.cloud_services.config_cache import config_cache
+from app.cloud_services.category_stats import get_category_stats
 from app.models.vertex_text import vertex_text_client
+from app.config.settings import settings
+from app.utils.cache import LRUCache, SingleFlight
+from app.utils.price_utils import round_to_nearest
+from app.utils.scheduler import Priority, scheduling
 
 logger = logging.getLogger(__name__)
 
+# Explanations keyed by bucketed inputs; the same rounded prices get the same wording
+_explanation_cache = LRUCache(
+    max_size=settings.PRICE_EXPLANATION_CACHE_SIZE,
+    ttl_s=settings.PRICE_EXPLANATION_CACHE_TTL_S,
+    name="price_explanations",
+)
+_explanation_flights = SingleFlight()
+
 class PriceSuggestionService:
     async def get_pricing_data(self, category: str) -> dict:
         """Fetches all necessary pricing rules and comparable data in one go."""
-        rules_doc = await db.collection('pricing_rules').document('default').get()
-        rules = rules_doc.to_dict() if rules_doc.exists else {}
+        # Served from the shared config cache; refreshed in the background
+        rules = await config_cache.get('pricing_rules', 'default')
 
-        products_ref = db.collection('products').where(filter=firestore.FieldFilter('category', '==', category))
-        docs = products_ref.stream()
-        prices = [doc.to_dict().get('price', 0) async for doc in docs if doc.exists]
-        
-        market_avg = sum(prices) / len(prices) if prices else 0.0
+        # Pre-aggregated count/sum/sketch: one cached read regardless of category size
+        stats = await get_category_stats(category)
         
         return {
             "rules": rules,
-            "num_comparables": len(prices),
-            "market_avg": market_avg
+            "num_comparables": stats["count"],
+            "market_avg": stats["avg"],
+            "market_percentiles": stats["percentiles"],
         }
 
     def _determine_confidence(self, num_comparables: int) -> str:
@@ -31,12 +44,12 @@ class PriceSuggestionService:
             return "Medium"
         return "Low"
 
-    async def generate_explanation(self, inputs: dict) -> str:
-        """Uses Gemini to generate an empathetic and encouraging explanation."""
+    def _explanation_prompts(self, inputs: dict) -> tuple:
         system_prompt = """
         You are a kind and encouraging business advisor for artisans. Your goal is to explain a price suggestion in a simple, positive, and empowering way.
         - Start by acknowledging the artisan's hard work.
-        - Justify the price based on the provided costs, labor, and margin.
+        - Justify the price based on the provided costs, labor, and margin. These figures are approximate: describe them in words or as approximations, never as exact amounts.
+        - The only exact figures you may quote are those of the final suggested price range.
         - Reference the market data and the confidence level to build trust.
         - End with an encouraging statement that the final decision is theirs.
         - Keep the explanation concise (3-4 sentences) and use Indian Rupees (₹) as the currency symbol.
@@ -48,62 +61,201 @@ class PriceSuggestionService:
             "High": "This price is strongly aligned with the current market, positioning your beautiful work competitively."
         }[inputs['confidence']]
 
+        # Cost figures are rounded (see _bucket_explanation_inputs), so they are labelled as such
+        labor_hours = inputs['labor_hours']
+        labor_text = "less than half an hour" if labor_hours < 0.5 else f"about {labor_hours:g} hours"
+
         user_prompt = f"""
         Here is the data for a price suggestion. Please write the explanation.
-        - Material Cost: ₹{inputs['materials_cost']:.2f}
-        - Labor Hours: {inputs['labor_hours']} hours
-        - Calculated Base Price (Cost + Labor + Margin): ₹{inputs['base_price']:.2f}
+        - Approximate Material Cost: about ₹{inputs['materials_cost']:.0f}
+        - Approximate Labor: {labor_text}
+        - Approximate Base Price (Cost + Labor + Margin): about ₹{inputs['base_price']:.0f}
         - Confidence Level: {inputs['confidence']}
         - Market Context: {confidence_text}
         - Final Suggested Price Range: ₹{inputs['min_price']:.0f} to ₹{inputs['max_price']:.0f}
         """
-        
-        explanation = await vertex_text_client.generate_content(system_prompt, user_prompt)
-        return explanation
+        return system_prompt, user_prompt
 
-    async def suggest_price(self, materials_cost: float, labor_hours: float, category: str) -> dict:
-        pricing_data = await self.get_pricing_data(category)
-        rules = pricing_data['rules']
-        num_comparables = pricing_data['num_comparables']
-        
-        confidence = self._determine_confidence(num_comparables)
+    def _bucket_explanation_inputs(self, inputs: dict) -> dict:
+        """
+        Snaps the explanation inputs to the precision the artisan sees, so near-identical
+        requests share one prompt and one cached explanation. The price range matches the
+        rounded range in the response exactly; the cost figures are only approximations
+        of what the artisan entered, and the prompt presents them that way.
+        """
+        return {
+            "category": inputs['category'],
+            "confidence": inputs['confidence'],
+            "materials_cost": round_to_nearest(inputs['materials_cost'], 5),
+            "labor_hours": round_to_nearest(inputs['labor_hours'], 0.5),
+            "base_price": round_to_nearest(inputs['base_price'], 5),
+            "min_price": round_to_nearest(inputs['min_price'], 5),
+            "max_price": round_to_nearest(inputs['max_price'], 5),
+        }
+
+    @staticmethod
+    def _explanation_cache_key(bucketed: dict) -> tuple:
+        return tuple(sorted(bucketed.items()))
+
+    async def generate_explanation(self, inputs: dict) -> str:
+        """Uses Gemini to generate an empathetic and encouraging explanation."""
+        bucketed = self._bucket_explanation_inputs(inputs)
+        cache_key = self._explanation_cache_key(bucketed)
+        explanation = _explanation_cache.get(cache_key)
+        if explanation is not None:
+            return explanation
+
+        async def generate() -> str:
+            system_prompt, user_prompt = self._explanation_prompts(bucketed)
+            text = await vertex_text_client.generate_content(system_prompt, user_prompt)
+            _explanation_cache.set(cache_key, text)
+            return text
+
+        # Identical items in one batch share a single Gemini call
+        return await _explanation_flights.do(cache_key, generate)
+
+    async def stream_explanation(self, inputs: dict) -> AsyncIterator[str]:
+        """Like generate_explanation, but yields the text as Gemini produces it."""
+        bucketed = self._bucket_explanation_inputs(inputs)
+        cache_key = self._explanation_cache_key(bucketed)
+        explanation = _explanation_cache.get(cache_key)
+        if explanation is not None:
+            yield explanation
+            return
+
+        system_prompt, user_prompt = self._explanation_prompts(bucketed)
+        parts = []
+        async for chunk in vertex_text_client.stream_content(system_prompt, user_prompt):
+            parts.append(chunk)
+            yield chunk
+        _explanation_cache.set(cache_key, "".join(parts).strip())
+
+    def _compute_ranges(self, items: List[tuple], rules: dict, stats_by_category: Dict[str, dict]) -> List[tuple]:
+        """
+        Vectorised price ranges for (materials_cost, labor_hours, category) items that share
+        one set of rules. Returns (price fields, explanation inputs) per item, in order.
+        """
+        materials_costs = np.array([item[0] for item in items], dtype=float)
+        labor_hours = np.array([item[1] for item in items], dtype=float)
+        categories = [item[2] for item in items]
+        num_comparables = np.array([stats_by_category[c]["count"] for c in categories])
+        market_avgs = np.array([stats_by_category[c]["avg"] for c in categories], dtype=float)
 
         hourly_rate = rules.get('hourly_rate_inr', 200)
         margin = rules.get('margin_percentage', 15)
         
-        cost_plus_labor = materials_cost + (labor_hours * hourly_rate)
-        base_price = cost_plus_labor * (1 + margin / 100)
+        cost_plus_labor = materials_costs + (labor_hours * hourly_rate)
+        base_prices = cost_plus_labor * (1 + margin / 100)
 
-        # De-risked market price calculation
-        if num_comparables > 1:
-            market_influence_price = pricing_data['market_avg']
-        else:
-            # Fallback to national average if not enough data
-            market_influence_price = rules.get('national_average_price', {}).get(category, base_price * 1.2)
+        # De-risked market price calculation: market average with enough comparables,
+        # otherwise the national average, otherwise 20% above the base price
+        national_average = rules.get('national_average_price', {})
+        fallback_prices = np.array([national_average.get(c, np.nan) for c in categories], dtype=float)
+        fallback_prices = np.where(np.isnan(fallback_prices), base_prices * 1.2, fallback_prices)
+        market_influence_prices = np.where(num_comparables > 1, market_avgs, fallback_prices)
 
         # Determine Range
-        min_price = base_price
-        max_price = max(base_price, market_influence_price * 1.1) # Ensure max is always > min
-        suggested_price = (min_price + max_price) / 2
-        
-        # Round prices to a cleaner number
-        def round_to_nearest_5(n):
-            return 5 * round(n / 5)
+        min_prices = base_prices
+        max_prices = np.maximum(base_prices, market_influence_prices * 1.1) # Ensure max is always > min
+        suggested_prices = (min_prices + max_prices) / 2
+
+        results = []
+        for i, (materials_cost, hours, category) in enumerate(items):
+            confidence = self._determine_confidence(int(num_comparables[i]))
+            base_price, min_price, max_price, suggested_price = (
+                float(base_prices[i]), float(min_prices[i]), float(max_prices[i]), float(suggested_prices[i])
+            )
+            explanation_inputs = {
+                "category": category,
+                "materials_cost": materials_cost, "labor_hours": hours,
+                "base_price": base_price, "confidence": confidence,
+                "min_price": min_price, "max_price": max_price,
+            }
+            # Round prices to a cleaner number
+            price = {
+                "min_price": round_to_nearest(min_price, 5),
+                "max_price": round_to_nearest(max_price, 5),
+                "suggested_price": round_to_nearest(suggested_price, 5),
+                "confidence": confidence,
+            }
+            results.append((price, explanation_inputs))
+        return results
+
+    async def compute_price(self, materials_cost: float, labor_hours: float, category: str) -> tuple:
+        """
+        The numeric part of a suggestion, without the LLM explanation.
+        Returns (price fields, inputs for the explanation).
+        """
+        pricing_data = await self.get_pricing_data(category)
+        stats = {"count": pricing_data['num_comparables'], "avg": pricing_data['market_avg']}
+        return self._compute_ranges([(materials_cost, labor_hours, category)], pricing_data['rules'], {category: stats})[0]
+
+    async def suggest_price(self, materials_cost: float, labor_hours: float, category: str) -> dict:
+        price, explanation_inputs = await self.compute_price(materials_cost, labor_hours, category)
 
         # Generate Explanation
-        explanation_inputs = {
-            "materials_cost": materials_cost, "labor_hours": labor_hours,
-            "base_price": base_price, "confidence": confidence,
-            "min_price": min_price, "max_price": max_price,
-        }
         explanation = await self.generate_explanation(explanation_inputs)
 
-        return {
-            "min_price": round_to_nearest_5(min_price),
-            "max_price": round_to_nearest_5(max_price),
-            "suggested_price": round_to_nearest_5(suggested_price),
-            "explanation": explanation,
-            "confidence": confidence,
-        }
+        return {**price, "explanation": explanation}
+
+    async def stream_suggestion(self, materials_cost: float, labor_hours: float, category: str) -> AsyncIterator[dict]:
+        """
+        Streaming variant of suggest_price: a "price" event as soon as the range is known,
+        then "explanation" events carrying text deltas, then "done" with the full explanation.
+        """
+        price, explanation_inputs = await self.compute_price(materials_cost, labor_hours, category)
+        yield {"event": "price", **price}
+
+        parts = []
+        async for delta in self.stream_explanation(explanation_inputs):
+            parts.append(delta)
+            yield {"event": "explanation", "delta": delta}
+
+        yield {"event": "done", "explanation": "".join(parts).strip()}
+
+    async def suggest_prices_batch(self, items: List[dict]) -> AsyncIterator[dict]:
+        """
+        Price suggestions for many items (e.g. a catalogue import). Rules are read once,
+        market stats once per category, all ranges are computed in one vectorised pass,
+        and explanations run with bounded concurrency. Yields one event per item as it
+        completes, in completion order, then a final "done" event.
+        """
+        rules = await config_cache.get('pricing_rules', 'default')
+        categories = list(dict.fromkeys(item['category'] for item in items))
+        stats = await asyncio.gather(*(get_category_stats(c) for c in categories))
+        stats_by_category = dict(zip(categories, stats))
+
+        ranges = self._compute_ranges(
+            [(item['materials_cost'], item['labor_hours'], item['category']) for item in items],
+            rules,
+            stats_by_category,
+        )
+
+        semaphore = asyncio.Semaphore(settings.PRICING_BATCH_CONCURRENCY)
+
+        async def explain(index: int) -> dict:
+            price, explanation_inputs = ranges[index]
+            event = {"event": "item", "index": index, "item_id": items[index].get('item_id'), **price}
+            try:
+                # Catalogue imports queue behind interactive suggestions
+                with scheduling(Priority.BATCH, settings.SCHEDULER_BATCH_BUDGET_S):
+                    async with semaphore:
+                        event["explanation"] = await self.generate_explanation(explanation_inputs)
+            except Exception as e:
+                # The numbers are still useful without the text
+                logger.error(f"Explanation failed for batch item {index}: {e}")
+                event.update(event="item_error", explanation=None, detail=str(e))
+            return event
+
+        tasks = [asyncio.create_task(explain(i)) for i in range(len(items))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client went away: stop queued explanations instead of calling Gemini for nobody
+            for task in tasks:
+                task.cancel()
+
+        yield {"event": "done", "count": len(items)}
 
 price_suggestion_service = PriceSuggestionService()
\ No newline at end of file
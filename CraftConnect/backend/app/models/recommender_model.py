@@ -1,52 +1,67 @@
-from typing import List
+from typing import Dict, List
 import logging
 from datetime import datetime, timedelta, timezone
 import numpy as np
 from app.cloud_services.firestore_db import db
 from app.cloud_services.faiss_service import faiss_index
 from app.models.vertex_text import vertex_text_client
+from app.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Neighbours fetched per live search; the product itself is usually one of them
+SEARCH_K = 5
+
 class RecommenderService:
-    async def get_recommendations(self, product_id: str, fairness_boost: bool = False) -> List[dict]:
-        print("\n--- STARTING RECOMMENDATION TRACE ---")
-
-        # 1. Fetch the target product's data and embedding
-        product_ref = db.collection('products').document(product_id)
-        product_doc = await product_ref.get()
-        print(f"DEBUG 1: Fetched product doc for '{product_id}'. Exists: {product_doc.exists}")
-        if not product_doc.exists:
-            print("--- ENDING TRACE: Product not found ---")
-            return []
-        
-        product_data = product_doc.to_dict()
-        query_embedding = product_data.get('description_embedding')
-        print(f"DEBUG 2: Found embedding for product? {'Yes' if query_embedding else 'No'}")
-        if not query_embedding:
-            print("--- ENDING TRACE: Embedding not found in document ---")
-            return []
+    async def _live_candidates(self, product_id: str) -> List[str]:
+        """Embedding lookup plus a live FAISS search, for products newer than the neighbour table."""
+        # 1. Source embedding from the local vector store; Firestore only for products
+        #    that are newer than the served index version
+        query_embedding = faiss_index.get_vector(product_id)
+        logger.debug(f"Embedding for '{product_id}' in local vector store? {'Yes' if query_embedding is not None else 'No'}")
+        if query_embedding is None:
+            metrics.incr("recommender.source_vector.firestore")
+            product_ref = db.collection('products').document(product_id)
+            product_doc = await product_ref.get()
+            logger.debug(f"Fetched product doc for '{product_id}'. Exists: {product_doc.exists}")
+            if not product_doc.exists:
+                logger.debug(f"Product '{product_id}' not found.")
+                return []
+
+            query_embedding = product_doc.to_dict().get('description_embedding')
+            if not query_embedding:
+                logger.debug(f"No embedding in the document of product '{product_id}'.")
+                return []
+        else:
+            metrics.incr("recommender.source_vector.local")
 
         # 2. Find N nearest neighbors in FAISS
-        candidate_ids = faiss_index.search(np.array(query_embedding), k=5)
-        print(f"DEBUG 3: FAISS search returned IDs: {candidate_ids}")
+        return faiss_index.search(np.array(query_embedding), k=SEARCH_K)
+
+    async def get_recommendations(self, product_id: str, fairness_boost: bool = False) -> List[dict]:
+        # Precomputed neighbour table first: a memory lookup for products already indexed
+        candidate_ids = faiss_index.precomputed_neighbors(product_id, k=SEARCH_K - 1)
+        if candidate_ids is not None:
+            metrics.incr("recommender.neighbors.precomputed")
+            logger.debug(f"Neighbour table returned IDs: {candidate_ids}")
+        else:
+            metrics.incr("recommender.neighbors.live")
+            candidate_ids = await self._live_candidates(product_id)
+            logger.debug(f"FAISS search returned IDs: {candidate_ids}")
         
         # Filter out the original product_id from the results
         candidate_ids = [pid for pid in candidate_ids if pid != product_id]
-        print(f"DEBUG 4: Candidate IDs after filtering self: {candidate_ids}")
         if not candidate_ids:
-            print("--- ENDING TRACE: No other similar products found ---")
+            logger.debug(f"No other similar products found for '{product_id}'.")
             return []
 
         # 3. Fetch candidate product details from Firestore
         candidate_docs = await db.collection('products').where('__name__', 'in', candidate_ids).get()
         candidates = [{'id': doc.id, **doc.to_dict()} for doc in candidate_docs]
-        print(f"DEBUG 5: Fetched {len(candidates)} candidate details from Firestore.")
+        logger.debug(f"Fetched {len(candidates)} candidate details from Firestore.")
 
         # ... (the rest of the function for fairness and explanations remains the same) ...
         # ... it will just return empty if len(candidates) is 0 ...
-        print("--- ENDING TRACE: Preparing final recommendations ---")
-        
         # For this test, we will just return the raw candidates to see if we get this far
         final_recommendations = []
         for rec_product in candidates[:5]:
@@ -59,5 +74,65 @@ class RecommenderService:
             
         return final_recommendations
 
+    async def _get_documents(self, product_ids: List[str]) -> Dict[str, dict]:
+        """Fetches many product documents in a single batched Firestore read."""
+        if not product_ids:
+            return {}
+        refs = [db.collection('products').document(pid) for pid in product_ids]
+        return {doc.id: doc.to_dict() async for doc in db.get_all(refs) if doc.exists}
+
+    async def get_recommendations_batch(self, product_ids: List[str], fairness_boost: bool = False) -> Dict[str, List[dict]]:
+        """
+        Similar-product lists for many products at once: neighbour-table lookups,
+        then one bulk read for missing source embeddings, one vectorised FAISS
+        search and one bulk read for the candidate details.
+        """
+        unique_ids = list(dict.fromkeys(product_ids))
+        results: Dict[str, List[dict]] = {pid: [] for pid in unique_ids}
+
+        # 0. Products covered by the precomputed neighbour table need no search at all
+        candidate_ids_by_product = {}
+        for pid in unique_ids:
+            neighbours = faiss_index.precomputed_neighbors(pid, k=SEARCH_K - 1)
+            if neighbours is not None:
+                candidate_ids_by_product[pid] = neighbours
+        search_ids = [pid for pid in unique_ids if pid not in candidate_ids_by_product]
+        metrics.incr("recommender.neighbors.precomputed", len(candidate_ids_by_product))
+        metrics.incr("recommender.neighbors.live", len(search_ids))
+
+        # 1. Source embeddings from the local vector store, with one bulk Firestore read for the rest
+        source_vectors = faiss_index.get_vectors(search_ids)
+        missing_ids = [pid for pid in search_ids if pid not in source_vectors]
+        metrics.incr("recommender.source_vector.local", len(source_vectors))
+        metrics.incr("recommender.source_vector.firestore", len(missing_ids))
+        for pid, data in (await self._get_documents(missing_ids)).items():
+            if data.get('description_embedding'):
+                source_vectors[pid] = data['description_embedding']
+
+        # 2. One FAISS call for everything left
+        query_ids = [pid for pid in search_ids if pid in source_vectors]
+        if query_ids:
+            query_matrix = np.array([source_vectors[pid] for pid in query_ids], dtype='float32')
+            neighbours = faiss_index.search_batch(query_matrix, k=SEARCH_K)
+            for pid, ids in zip(query_ids, neighbours):
+                candidate_ids_by_product[pid] = [cid for cid in ids if cid != pid]
+
+        # 3. Fetch the details of every distinct candidate in one round trip
+        all_candidate_ids = list(dict.fromkeys(cid for ids in candidate_ids_by_product.values() for cid in ids))
+        candidates = await self._get_documents(all_candidate_ids)
+
+        for pid, candidate_ids in candidate_ids_by_product.items():
+            results[pid] = [
+                {
+                    "id": cid,
+                    "name": candidates[cid].get('name', 'N/A'),
+                    "image_url": candidates[cid].get('image_url', ''),
+                    "explanation": "Test explanation"  # Matches the single-product endpoint for now
+                }
+                for cid in candidate_ids[:5] if cid in candidates
+            ]
+
+        return results
+
 
 recommender_service = RecommenderService()
\ No newline at end of file
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.config.settings import settings
+from app.utils.cache import LRUCache
+from app.utils.metrics import metrics
+from app.utils.scheduler import Priority, scheduling
+from app.utils.text_utils import text_hash
+
+logger = logging.getLogger(__name__)
+
+
+def response_scope(model_name: str, generation_config: dict, system_prompt: str, partition: str = "") -> str:
+    """
+    Everything besides the user prompt that determines a response; cached entries never
+    cross scopes. partition narrows it further, e.g. to one artisan's heritage text, so
+    semantic matches cannot serve one owner's response to another.
+    """
+    payload = json.dumps([model_name, generation_config, system_prompt, partition], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SemanticResponseCache:
+    """
+    Reuses a response when a new prompt's embedding is at least `threshold` cosine-similar
+    to a cached prompt in the same scope. Bounded (LRU) and TTL'd; each lookup is one
+    matrix-vector product over the scope's cached embeddings.
+    """
+
+    def __init__(self, embed: Callable[[str], Awaitable[List[float]]], max_size: int, ttl_s: float, threshold: float):
+        self.embed = embed
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        # key -> (scope, unit vector, response, expires_at)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._matrices: Dict[str, tuple] = {}  # scope -> (keys, stacked vectors), rebuilt after changes
+
+    async def _vector(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(await self.embed(prompt), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _matrix(self, scope: str) -> tuple:
+        if scope not in self._matrices:
+            keys = [key for key, entry in self._entries.items() if entry[0] == scope]
+            vectors = np.stack([self._entries[key][1] for key in keys]) if keys else None
+            self._matrices[scope] = (keys, vectors)
+        return self._matrices[scope]
+
+    def _drop(self, key: str):
+        scope = self._entries.pop(key)[0]
+        self._matrices.pop(scope, None)
+
+    async def get(self, scope: str, prompt: str) -> Optional[str]:
+        keys, vectors = self._matrix(scope)
+        if not keys:
+            return None
+
+        similarities = vectors @ await self._vector(prompt)
+        now = time.monotonic()
+        for index in np.argsort(-similarities):
+            if similarities[index] < self.threshold:
+                break
+            key = keys[index]
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[3] <= now:
+                self._drop(key)
+                continue
+            self._entries.move_to_end(key)
+            metrics.incr("response_cache.semantic_hits")
+            return entry[2]
+
+        metrics.incr("response_cache.semantic_misses")
+        return None
+
+    async def set(self, scope: str, prompt: str, response: str):
+        key = f"{scope}:{text_hash(prompt)}"
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (scope, await self._vector(prompt), response, time.monotonic() + self.ttl_s)
+        self._matrices.pop(scope, None)
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+
+class ResponseCache:
+    """
+    Two-tier cache for generated text. The exact tier matches (model, generation config,
+    system prompt, normalised user prompt). The optional semantic tier also matches user
+    prompts whose embeddings are near-identical, for callers that opt in: fine for prose
+    such as stories, wrong for prompts whose numbers must appear in the answer.
+    """
+
+    def __init__(self, max_size: int, ttl_s: float, semantic: Optional[SemanticResponseCache] = None):
+        self.exact = LRUCache(max_size=max_size, ttl_s=ttl_s, name="gemini_responses")
+        self.semantic = semantic
+        self._tasks = set()
+
+    async def get(self, scope: str, prompt: str, semantic: bool = False) -> Optional[str]:
+        response = self.exact.get(f"{scope}:{text_hash(prompt)}")
+        if response is None and semantic and self.semantic is not None:
+            try:
+                response = await self.semantic.get(scope, prompt)
+            except Exception as e:
+                # A failed embedding only costs the cache hit
+                logger.warning(f"Semantic cache lookup failed: {e}")
+        return response
+
+    async def set(self, scope: str, prompt: str, response: str, semantic: bool = False):
+        self.exact.set(f"{scope}:{text_hash(prompt)}", response)
+        if semantic and self.semantic is not None:
+            # Embedding the prompt would delay the caller's response: insert in the background
+            task = asyncio.ensure_future(self._set_semantic(scope, prompt, response))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _set_semantic(self, scope: str, prompt: str, response: str):
+        try:
+            # Filling the cache is never urgent
+            with scheduling(Priority.BATCH, settings.SCHEDULER_BATCH_BUDGET_S):
+                await self.semantic.set(scope, prompt, response)
+        except Exception as e:
+            logger.warning(f"Could not add response to the semantic cache: {e}")
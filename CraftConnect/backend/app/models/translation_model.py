@@ -1,62 +1,246 @@
+import asyncio
+import json
 import logging
-import re
+import numpy as np
+from typing import Dict, List, Optional
 from google.cloud import translate_v3 as translate
 from app.config.settings import settings
-from app.cloud_services.firestore_db import get_artisan_glossary
+from app.cloud_services.glossary_cache import glossary_cache
 from app.models.embeddings import embedding_client  # ✅ singleton instance
+from app.utils.cache import LRUCache, SqliteStore
+from app.utils.metrics import metrics
+from app.utils.scheduler import Priority, scheduling, slot
+from app.utils.text_utils import compile_glossary, glossary_version, text_hash
 
 logger = logging.getLogger(__name__)
 
 
+class TranslationMemory:
+    """
+    Translation memory keyed by (translation model, embedding model, target language,
+    glossary version, normalised source hash). Stores the translated text and its QA
+    score: an in-memory LRU in front of an optional SQLite file that survives restarts.
+    """
+
+    def __init__(self, max_size: int, path: Optional[str] = None):
+        self.memory = LRUCache(max_size=max_size, name="translation_memory")
+        self.disk = SqliteStore(
+            path, table="translations",
+            max_rows=settings.TRANSLATION_MEMORY_MAX_ROWS, max_age_s=settings.TRANSLATION_MEMORY_MAX_AGE_S,
+        ) if path else None
+
+    def key(self, text: str, target_language_code: str, glossary_version: str) -> str:
+        return (
+            f"{settings.TRANSLATION_MODEL_ID}:{settings.EMBEDDING_MODEL_ID}:"
+            f"{target_language_code}:{glossary_version}:{text_hash(text)}"
+        )
+
+    async def get_many(self, keys: List[str]) -> Dict[str, dict]:
+        found = {}
+        for key in keys:
+            entry = self.memory.get(key)
+            if entry is not None:
+                found[key] = entry
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.disk is not None:
+            loop = asyncio.get_running_loop()
+            rows = await loop.run_in_executor(None, self.disk.get_many, missing)
+            for key, blob in rows.items():
+                entry = json.loads(blob)
+                self.memory.set(key, entry)
+                found[key] = entry
+            metrics.incr("translation_memory.disk_hits", len(rows))
+
+        metrics.incr("translation_memory.hits", len(found))
+        metrics.incr("translation_memory.misses", len(keys) - len(found))
+        return found
+
+    async def set_many(self, entries: Dict[str, dict]):
+        for key, entry in entries.items():
+            self.memory.set(key, entry)
+        if self.disk is not None and entries:
+            loop = asyncio.get_running_loop()
+            blobs = {key: json.dumps(entry, ensure_ascii=False).encode("utf-8") for key, entry in entries.items()}
+            await loop.run_in_executor(None, self.disk.set_many, blobs)
+
+
 class TranslationService:
     def __init__(self):
-        self.translate_client = translate.TranslationServiceClient()
+        self.translate_client = translate.TranslationServiceAsyncClient()
         self.parent = f"projects/{settings.PROJECT_ID}/locations/{settings.EMBEDDING_REGION}"
         self.embedding_client = embedding_client  # ✅ use singleton directly
+        self.model = f"{self.parent}/models/{settings.TRANSLATION_MODEL_ID}"
+        self.memory = TranslationMemory(
+            max_size=settings.TRANSLATION_MEMORY_SIZE,
+            path=settings.TRANSLATION_MEMORY_PATH or None,
+        )
 
-    def _apply_glossary(self, text: str, glossary: dict) -> str:
+    def _apply_glossary(self, text: str, glossary: dict, version: str = None) -> str:
         """Apply custom artisan glossary before translation."""
         if not glossary:
             return text
 
         logger.info("Applying custom artisan glossary...")
-        for term, translation in glossary.items():
-            text = re.sub(rf"\b{re.escape(term)}\b", translation, text, flags=re.IGNORECASE)
-        return text
+        # One compiled pass over the text, reused until the glossary changes
+        return compile_glossary(glossary, version).apply(text)
+
+    def _chunks(self, texts: List[str]) -> List[List[str]]:
+        """Splits texts into translate_text requests within the per-request content and size limits."""
+        chunks, current, codepoints = [], [], 0
+        for text in texts:
+            if current and (
+                len(current) >= settings.TRANSLATION_MAX_CONTENTS
+                or codepoints + len(text) > settings.TRANSLATION_MAX_CODEPOINTS
+            ):
+                chunks.append(current)
+                current, codepoints = [], 0
+            current.append(text)
+            codepoints += len(text)
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def _translate_many(self, texts: List[str], target_language: str, source_language: str = "en") -> List[str]:
+        """Translates many texts with as few requests as the API limits allow, returned in input order."""
+        async def translate_chunk(chunk: List[str]):
+            async with slot("translation"):
+                return await self.translate_client.translate_text(
+                    request={
+                        "parent": self.parent,
+                        "model": self.model,
+                        "contents": chunk,
+                        "mime_type": "text/plain",
+                        "source_language_code": source_language,
+                        "target_language_code": target_language,
+                    }
+                )
+
+        responses = await asyncio.gather(*(translate_chunk(chunk) for chunk in self._chunks(texts)))
+        return [translation.translated_text for response in responses for translation in response.translations]
 
-    def _translate(self, text: str, target_language: str, source_language: str = "en") -> str:
+    async def _translate(self, text: str, target_language: str, source_language: str = "en") -> str:
         """Perform translation using Google Cloud Translation v3."""
-        response = self.translate_client.translate_text(
-            request={
-                "parent": self.parent,
-                "contents": [text],
-                "mime_type": "text/plain",
-                "source_language_code": source_language,
-                "target_language_code": target_language,
-            }
-        )
-        return response.translations[0].translated_text
+        translations = await self._translate_many([text], target_language, source_language)
+        return translations[0]
+
+    async def _remembered(self, texts: List[str], target_language_code: str, artisan_id: Optional[str]) -> tuple:
+        """Glossary for the language, the memory key of each text and the entries already remembered."""
+        glossary, version = await glossary_cache.get(artisan_id, target_language_code) if artisan_id else ({}, None)
+        version = version or glossary_version(glossary)
+        keys = [self.memory.key(text, target_language_code, version) for text in texts]
+        return glossary, version, keys, await self.memory.get_many(keys)
 
     async def translate_with_qa(self, text: str, target_language_code: str, artisan_id: str = None) -> dict:
-        glossary = await get_artisan_glossary(artisan_id, target_language_code) if artisan_id else {}
-        text_with_glossary = self._apply_glossary(text, glossary)
+        glossary, version, (key,), remembered = await self._remembered([text], target_language_code, artisan_id)
+        if key in remembered:
+            # Exact repeat: no translation or embedding calls
+            return remembered[key]
 
-        translated_text = self._translate(text_with_glossary, target_language_code)
-        back_translated_text = self._translate(translated_text, "en", target_language_code)
+        # The original text's embedding only depends on the input: start it right away so it
+        # runs alongside the critical path (translate -> back-translate -> embed)
+        original_embedding_task = asyncio.create_task(self.embedding_client.get_embedding(text))
+        try:
+            text_with_glossary = self._apply_glossary(text, glossary, version)
 
-        # ✅ use embedding client correctly
-        original_embedding = await self.embedding_client.get_embedding(text)
-        back_translated_embedding = await self.embedding_client.get_embedding(back_translated_text)
+            translated_text = await self._translate(text_with_glossary, target_language_code)
+            back_translated_text = await self._translate(translated_text, "en", target_language_code)
+
+            back_translated_embedding = await self.embedding_client.get_embedding(back_translated_text)
+            original_embedding = await original_embedding_task
+        except BaseException:
+            original_embedding_task.cancel()
+            raise
 
         quality_score = self.embedding_client.get_cosine_similarity(
             original_embedding, back_translated_embedding
         )
         logger.info(f"Translation QA Score: {quality_score:.4f}")
 
-        return {
+        result = {
             "translated_text": translated_text,
             "quality_score": quality_score,
         }
+        await self.memory.set_many({key: result})
+        return result
+
+    async def _round_trip(self, texts: List[str], target_language_code: str, glossary: dict, version: str) -> tuple:
+        """Forward and back translations of all texts into one language."""
+        if not texts:
+            return [], []
+        prepared = [self._apply_glossary(text, glossary, version) for text in texts]
+        translated = await self._translate_many(prepared, target_language_code)
+        back_translated = await self._translate_many(translated, "en", target_language_code)
+        return translated, back_translated
+
+    async def translate_batch_with_qa(
+        self, texts: List[str], target_language_codes: List[str], artisan_id: str = None
+    ) -> List[Dict[str, dict]]:
+        """
+        Translates every text into every language. Pairs already in the translation memory
+        are served locally. For the rest, each language is one pipeline of packed
+        translate_text requests, all languages run concurrently, originals and
+        back-translations are embedded in bulk, and all QA scores come from one matrix
+        computation. Returns one {language: {translated_text, quality_score}} per text.
+        """
+        # Bulk localisation queues behind interactive translations
+        with scheduling(Priority.BATCH, settings.SCHEDULER_BATCH_BUDGET_S):
+            return await self._translate_batch_with_qa(texts, target_language_codes, artisan_id)
+
+    async def _translate_batch_with_qa(
+        self, texts: List[str], target_language_codes: List[str], artisan_id: Optional[str]
+    ) -> List[Dict[str, dict]]:
+        lookups = await asyncio.gather(*(
+            self._remembered(texts, language, artisan_id) for language in target_language_codes
+        ))
+        # (language index, text index) pairs that still need translating
+        pending = [
+            [t for t, key in enumerate(keys) if key not in remembered]
+            for _, _, keys, remembered in lookups
+        ]
+        needed = sorted({t for indices in pending for t in indices})
+
+        if needed:
+            original_embeddings_task = asyncio.create_task(
+                self.embedding_client.get_embeddings([texts[t] for t in needed])
+            )
+            try:
+                round_trips = await asyncio.gather(*(
+                    self._round_trip([texts[t] for t in pending[l]], language, lookups[l][0], lookups[l][1])
+                    for l, language in enumerate(target_language_codes)
+                ))
+                back_translations = [text for _, back_translated in round_trips for text in back_translated]
+                back_embeddings = await self.embedding_client.get_embeddings(back_translations)
+                original_embeddings = await original_embeddings_task
+            except BaseException:
+                original_embeddings_task.cancel()
+                raise
+
+            # Row-normalise both matrices, then one row-wise dot product scores every pair
+            row_of = {t: row for row, t in enumerate(needed)}
+            originals = np.asarray(original_embeddings, dtype=np.float32)
+            originals = originals[[row_of[t] for indices in pending for t in indices]]
+            backs = np.asarray(back_embeddings, dtype=np.float32)
+            originals /= np.maximum(np.linalg.norm(originals, axis=-1, keepdims=True), 1e-12)
+            backs /= np.maximum(np.linalg.norm(backs, axis=-1, keepdims=True), 1e-12)
+            scores = iter(np.einsum("pd,pd->p", originals, backs).tolist())
+
+            fresh = {}
+            for l, (translated, _) in enumerate(round_trips):
+                keys, remembered = lookups[l][2], lookups[l][3]
+                for t, translated_text in zip(pending[l], translated):
+                    result = {"translated_text": translated_text, "quality_score": next(scores)}
+                    remembered[keys[t]] = result
+                    fresh[keys[t]] = result
+            await self.memory.set_many(fresh)
+
+        return [
+            {
+                language: lookups[l][3][lookups[l][2][t]]
+                for l, language in enumerate(target_language_codes)
+            }
+            for t in range(len(texts))
+        ]
 
 
 # ✅ Singleton instance
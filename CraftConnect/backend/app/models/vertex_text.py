@@ -1,21 +1,35 @@
+import asyncio
 import logging
+import time
+from typing import AsyncIterator, Optional
 from google.api_core.exceptions import GoogleAPICallError
 from vertexai.generative_models import GenerativeModel, GenerationConfig
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 
 from app.config.settings import settings
+from app.models.embeddings import embedding_client
+from app.models.response_cache import ResponseCache, SemanticResponseCache, response_scope
+from app.utils.metrics import metrics
+from app.utils.scheduler import QuotaExceeded, slot
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared by generate_content and stream_content
+CONTENT_GENERATION_CONFIG = dict(temperature=0.3, top_p=0.95, max_output_tokens=1024)
+# Creative but controlled output; shared by generate_story_from_prompts and stream_story
+STORY_GENERATION_CONFIG = dict(temperature=0.4, top_p=0.95, top_k=40, max_output_tokens=1024)
+
 class VertexTextGenerator:
     """
     A wrapper for Vertex AI's Generative Models (Gemini).
     Handles text generation tasks like the artisan storyteller.
     """
 
-    def __init__(self, model_name: str = settings.GEMINI_MODEL_ID):
-        """Initializes the Vertex AI client and model."""
+    def __init__(self, model_name: str = settings.GEMINI_MODEL_ID, response_cache: Optional[ResponseCache] = None):
+        """Initializes the Vertex AI client and model. Responses are cached when response_cache is given."""
+        self.model_name = model_name
+        self.response_cache = response_cache
         try:
             self.model = GenerativeModel(model_name)
             logger.info(f"Successfully initialized Vertex AI model: {model_name}")
@@ -23,48 +37,124 @@ class VertexTextGenerator:
             logger.error(f"Failed to initialize Vertex AI model: {e}", exc_info=True)
             raise
 
-    @retry(wait=wait_exponential(multiplier=1, min=2, max=6), stop=stop_after_attempt(3))
-    async def generate_content(self, system_prompt: str, user_prompt: str) -> str:
+    async def _cached(self, generation_config: dict, system_prompt: str, user_prompt: str,
+                      use_cache: bool, semantic: bool, partition: str = "") -> tuple:
+        """Returns (scope, cached response or None); scope is None when caching is off for this call."""
+        if not use_cache or self.response_cache is None:
+            return None, None
+        scope = response_scope(self.model_name, generation_config, system_prompt, partition)
+        return scope, await self.response_cache.get(scope, user_prompt, semantic=semantic)
+
+    async def _remember(self, scope: Optional[str], user_prompt: str, response: str, semantic: bool):
+        if scope is not None and response:
+            await self.response_cache.set(scope, user_prompt, response, semantic=semantic)
+
+    @retry(wait=wait_exponential(multiplier=1, min=2, max=6), stop=stop_after_attempt(3),
+           retry=retry_if_not_exception_type(QuotaExceeded))
+    async def generate_content(self, system_prompt: str, user_prompt: str, use_cache: bool = True) -> str:
         """
         A general-purpose method to generate text from a system and user prompt.
+        Identical prompts are served from the response cache unless use_cache is False.
         """
+        scope, cached = await self._cached(CONTENT_GENERATION_CONFIG, system_prompt, user_prompt, use_cache, semantic=False)
+        if cached is not None:
+            return cached
+
         try:
             logger.info("Generating content with Vertex AI Gemini...")
-            generation_config = GenerationConfig(
-                temperature=0.3,
-                top_p=0.95,
-                max_output_tokens=1024,
-            )
+            generation_config = GenerationConfig(**CONTENT_GENERATION_CONFIG)
             
-            response = await self.model.generate_content_async(
-                [system_prompt, user_prompt],
-                generation_config=generation_config
-            )
+            async with slot("gemini"):
+                response = await self.model.generate_content_async(
+                    [system_prompt, user_prompt],
+                    generation_config=generation_config
+                )
             
             generated_text = response.text.strip()
             logger.info("Successfully generated content.")
+            await self._remember(scope, user_prompt, generated_text, semantic=False)
             return generated_text
 
         except Exception as e:
             logger.error(f"An unexpected error occurred during content generation: {e}", exc_info=True)
             raise
 
-    # The original storyteller method can also use the new generic one, or stay as is.
-    # For simplicity, we will keep it separate for now.
-   
+    async def _cached_stream(self, system_prompt: str, user_prompt: str, generation_config: dict,
+                             use_cache: bool, semantic: bool, partition: str = "", **stream_kwargs) -> AsyncIterator[str]:
+        """_stream with the response cache in front: a hit is yielded as one chunk, a miss is stored once complete."""
+        scope, cached = await self._cached(generation_config, system_prompt, user_prompt, use_cache, semantic, partition)
+        if cached is not None:
+            yield cached
+            return
 
-    @retry(wait=wait_exponential(multiplier=1, min=4, max=10), stop=stop_after_attempt(3))
-    async def generate_story_from_prompts(self, artisan_heritage: str, piece_story: str) -> str:
-        """
-        Generates a polished product story from two prompts using Gemini.
+        parts = []
+        async for chunk in self._stream([system_prompt, user_prompt], GenerationConfig(**generation_config), **stream_kwargs):
+            parts.append(chunk)
+            yield chunk
+        await self._remember(scope, user_prompt, "".join(parts).strip(), semantic)
 
-        Args:
-            artisan_heritage: The artisan's background and craft context.
-            piece_story: The story behind the specific item.
+    async def _stream(self, contents: list, generation_config: GenerationConfig,
+                      attempts: int = 3, min_wait: float = 2, max_wait: float = 6,
+                      metric_name: str = "content") -> AsyncIterator[str]:
+        """
+        Streams generated text chunk by chunk. Failures are retried with exponential
+        backoff only until the first chunk has been yielded; after that a retry would
+        duplicate text the caller already forwarded, so the error is raised instead.
+        Time to first token (including retries) and total time are recorded under
+        gemini.<metric_name>.* in milliseconds.
+        """
+        started = time.monotonic()
+        for attempt in range(1, attempts + 1):
+            emitted = False
+            try:
+                # The slot is held for the whole stream, since it occupies the model just as long
+                async with slot("gemini"):
+                    responses = await self.model.generate_content_async(
+                        contents,
+                        generation_config=generation_config,
+                        stream=True
+                    )
+                    async for chunk in responses:
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # Chunks without a text part (e.g. the final usage-only chunk)
+                            continue
+                        if text:
+                            if not emitted:
+                                metrics.observe(f"gemini.{metric_name}.ttft_ms", (time.monotonic() - started) * 1000)
+                            emitted = True
+                            yield text
+                metrics.observe(f"gemini.{metric_name}.stream_ms", (time.monotonic() - started) * 1000)
+                return
+            except QuotaExceeded:
+                raise  # over capacity: fail fast instead of sleeping and retrying
+            except Exception as e:
+                if emitted or attempt == attempts:
+                    metrics.incr(f"gemini.{metric_name}.stream_errors")
+                    logger.error(f"Streaming generation failed (attempt {attempt}): {e}", exc_info=True)
+                    raise
+                metrics.incr(f"gemini.{metric_name}.stream_retries")
+                delay = min(max_wait, max(min_wait, 2 ** attempt))
+                logger.warning(f"Streaming generation failed before the first chunk, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
 
-        Returns:
-            A single, cohesive story as a string.
+    async def stream_content(self, system_prompt: str, user_prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """
+        Streaming counterpart of generate_content: yields text chunks as Gemini produces them.
         """
+        logger.info("Streaming content with Vertex AI Gemini...")
+        async for chunk in self._cached_stream(
+            system_prompt, user_prompt, CONTENT_GENERATION_CONFIG, use_cache, semantic=False
+        ):
+            yield chunk
+
+    # The original storyteller method can also use the new generic one, or stay as is.
+    # For simplicity, we will keep it separate for now.
+   
+
+    @staticmethod
+    def _story_prompts(artisan_heritage: str, piece_story: str) -> tuple:
         system_prompt = """
         You are an expert storyteller for an artisan marketplace. Your task is to weave together two distinct pieces of information from an artisan into a single, elegant, and compelling product description.
 
@@ -84,25 +174,47 @@ class VertexTextGenerator:
         **Part 2: The Story of This Specific Piece**
         "{piece_story}"
         """
+        return system_prompt, user_prompt
+
+    @retry(wait=wait_exponential(multiplier=1, min=4, max=10), stop=stop_after_attempt(3),
+           retry=retry_if_not_exception_type(QuotaExceeded))
+    async def generate_story_from_prompts(self, artisan_heritage: str, piece_story: str, use_cache: bool = True) -> str:
+        """
+        Generates a polished product story from two prompts using Gemini.
+
+        Args:
+            artisan_heritage: The artisan's background and craft context.
+            piece_story: The story behind the specific item.
+            use_cache: Set to False to always generate a fresh story (e.g. "regenerate").
+
+        Returns:
+            A single, cohesive story as a string.
+        """
+        system_prompt, user_prompt = self._story_prompts(artisan_heritage, piece_story)
+        # Stories may also reuse a near-identical prompt's response (e.g. after a typo fix),
+        # but only within the same artisan heritage text
+        scope, cached = await self._cached(
+            STORY_GENERATION_CONFIG, system_prompt, user_prompt, use_cache,
+            semantic=settings.STORY_SEMANTIC_CACHE, partition=artisan_heritage,
+        )
+        if cached is not None:
+            return cached
 
         try:
             logger.info("Generating story with Vertex AI Gemini...")
             # Configuration for creative but controlled output
-            generation_config = GenerationConfig(
-                temperature=0.4,
-                top_p=0.95,
-                top_k=40,
-                max_output_tokens=1024,
-            )
+            generation_config = GenerationConfig(**STORY_GENERATION_CONFIG)
             
             # Use async generation
-            response = await self.model.generate_content_async(
-                [system_prompt, user_prompt],
-                generation_config=generation_config
-            )
+            async with slot("gemini"):
+                response = await self.model.generate_content_async(
+                    [system_prompt, user_prompt],
+                    generation_config=generation_config
+                )
             
             generated_text = response.text.strip()
             logger.info("Successfully generated story.")
+            await self._remember(scope, user_prompt, generated_text, semantic=settings.STORY_SEMANTIC_CACHE)
             return generated_text
 
         except GoogleAPICallError as e:
@@ -112,5 +224,36 @@ class VertexTextGenerator:
             logger.error(f"An unexpected error occurred during story generation: {e}", exc_info=True)
             raise
 
+    async def stream_story(self, artisan_heritage: str, piece_story: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """
+        Streaming counterpart of generate_story_from_prompts: yields the story as Gemini
+        writes it, with the same backoff (retries only before the first chunk).
+        """
+        system_prompt, user_prompt = self._story_prompts(artisan_heritage, piece_story)
+        logger.info("Streaming story with Vertex AI Gemini...")
+        async for chunk in self._cached_stream(
+            system_prompt,
+            user_prompt,
+            STORY_GENERATION_CONFIG,
+            use_cache,
+            semantic=settings.STORY_SEMANTIC_CACHE,
+            partition=artisan_heritage,
+            min_wait=4,
+            max_wait=10,
+            metric_name="story",
+        ):
+            yield chunk
+
+def _build_response_cache() -> ResponseCache:
+    semantic = None
+    if settings.SEMANTIC_CACHE_THRESHOLD > 0:
+        semantic = SemanticResponseCache(
+            embed=embedding_client.get_embedding,
+            max_size=settings.SEMANTIC_CACHE_SIZE,
+            ttl_s=settings.RESPONSE_CACHE_TTL_S,
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+        )
+    return ResponseCache(max_size=settings.RESPONSE_CACHE_SIZE, ttl_s=settings.RESPONSE_CACHE_TTL_S, semantic=semantic)
+
 # Singleton instance to be used across the application
-vertex_text_client = VertexTextGenerator()
\ No newline at end of file
+vertex_text_client = VertexTextGenerator(response_cache=_build_response_cache())
\ No newline at end of file
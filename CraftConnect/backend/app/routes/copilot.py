@@ -1,11 +1,15 @@
-import hashlib
+import asyncio
 from fastapi import APIRouter, UploadFile, File, HTTPException, status
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional
 
-from app.cloud_services import storage, firestore_db
+from app.cloud_services import storage, analysis_cache
 from app.models import vertex_gemini # <-- Use the new Gemini model
 from app.utils import image_utils # For the enhancer fallback
+from app.utils import upload_utils
+from app.config.settings import settings
+from app.utils.scheduler import Priority, QuotaExceeded, scheduling
+from app.utils.streaming import ndjson_response
 
 #from app.models import vertex_imagen     #vertex_imagen.py       ------- image enhancement ****
 '''    import asyncio
@@ -30,47 +34,106 @@ class ImageAnalysisResponse(BaseModel):
     primary_colors: Optional[List[str]] = None
     estimated_dimensions_cm: Optional[str] = None
     confidence_score: float
+    thumbnail_uris: Optional[Dict[str, str]] = Field(None, description="WebP thumbnails keyed by their longest edge in pixels.")
 
-@router.post("/analyze", response_model=ImageAnalysisResponse)
-async def analyze_image(image_file: UploadFile = File(...)):
-    """Orchestrates the new, enhanced image analysis flow."""
-    contents = await image_file.read()
-    image_hash = hashlib.sha256(contents).hexdigest()
+async def normalize_and_upload(upload: upload_utils.SpooledUpload, image_hash: str) -> tuple:
+    """
+    Downscales and re-encodes the upload to WebP in the process pool, then uploads the
+    image and its thumbnails concurrently. Returns (gcs_uri, content_type, thumbnail_uris)
+    and closes the upload.
+    """
+    try:
+        # Workers read spooled files straight from disk instead of receiving the bytes
+        normalized = await image_utils.normalize_image_async(
+            upload.path or upload.read_bytes(),
+            max_edge=settings.IMAGE_MAX_EDGE,
+            quality=settings.IMAGE_WEBP_QUALITY,
+            thumbnail_edges=settings.IMAGE_THUMBNAIL_EDGES,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the uploaded image: {e}")
+    finally:
+        upload.close()
 
-    # NOTE: Caching logic can be enhanced to store the richer Gemini response.
-    # For now, we'll proceed with a live call to demonstrate the new logic.
+    content_type = normalized["content_type"]
+    edges = list(normalized["thumbnails"])
+    gcs_uri, *thumbnail_uris = await asyncio.gather(
+        storage.upload_file_async(normalized["image"], f"products/{image_hash}.webp", content_type),
+        *(
+            storage.upload_file_async(normalized["thumbnails"][edge], f"products/thumbnails/{image_hash}_{edge}.webp", content_type)
+            for edge in edges
+        ),
+    )
+    return gcs_uri, content_type, {str(edge): uri for edge, uri in zip(edges, thumbnail_uris) if uri}
 
-    file_extension = image_file.filename.split('.')[-1]
-    blob_name = f"products/{image_hash}.{file_extension}"
-    gcs_uri = await storage.upload_file_async(contents, blob_name)
-    if not gcs_uri:
-        raise HTTPException(status_code=500, detail="Failed to upload image.")
+async def analyze_spooled_upload(upload: upload_utils.SpooledUpload, file_extension: str) -> dict:
+    """
+    Cached upload + Gemini analysis of one spooled image. Always closes the upload:
+    once the shared analysis has started it owns the file and closes it itself.
+    """
+    image_hash = upload.sha256
+    analysis_started = False
 
-    # Call the new, robust Gemini analyzer
+    async def upload_and_analyze() -> dict:
+        nonlocal analysis_started
+        analysis_started = True
+        if settings.IMAGE_MAX_EDGE <= 0:
+            # Normalisation disabled: stream the original file as-is
+            try:
+                gcs_uri = await storage.upload_stream_async(
+                    upload.open(), f"products/{image_hash}.{file_extension}",
+                    upload.content_type or "image/jpeg", upload.size
+                )
+            finally:
+                upload.close()
+            content_type, thumbnail_uris = upload.content_type or "image/jpeg", {}
+        else:
+            gcs_uri, content_type, thumbnail_uris = await normalize_and_upload(upload, image_hash)
+        if not gcs_uri:
+            raise HTTPException(status_code=500, detail="Failed to upload image.")
+
+        # Call the new, robust Gemini analyzer
+        try:
+            analysis = await vertex_gemini.analyze_image_with_gemini(gcs_uri, mime_type=content_type)
+        except QuotaExceeded:
+            raise  # answered with 429 by the app's handler
+        except Exception as e:
+            # This will be triggered after all retries fail
+            raise HTTPException(status_code=500, detail=f"Vertex AI analysis failed after retries: {e}")
+        return {**analysis, "gcs_uri": gcs_uri, "thumbnail_uris": thumbnail_uris}
+
+    # Re-uploads of the same photo skip both the GCS upload and the Gemini call
     try:
-        analysis_data = await vertex_gemini.analyze_image_with_gemini(gcs_uri)
-    except Exception as e:
-        # This will be triggered after all retries fail
-        raise HTTPException(status_code=500, detail=f"Vertex AI analysis failed after retries: {e}")
+        return await analysis_cache.get_or_analyze(
+            image_hash, f"{vertex_gemini.ANALYSIS_VERSION}-{settings.IMAGE_MAX_EDGE}", upload_and_analyze
+        )
+    finally:
+        if not analysis_started:
+            upload.close()
 
+def analysis_status(score: float) -> str:
     # --- Implement Confidence Threshold Logic ---
-    score = analysis_data.get("confidence_score", 0.0)
-    status = "rejected" # Default to rejected
     if score >= 0.70:
-        status = "auto_accepted"
-    elif 0.40 <= score < 0.70:
-        status = "needs_confirmation"
+        return "auto_accepted"
+    if 0.40 <= score < 0.70:
+        return "needs_confirmation"
+    return "rejected"
+
+def build_analysis_response(analysis_data: dict) -> ImageAnalysisResponse:
+    score = analysis_data.get("confidence_score", 0.0)
+    status = analysis_status(score)
     
     # If rejected, we don't return the AI suggestions
     if status == "rejected":
         return ImageAnalysisResponse(
-            gcs_uri=gcs_uri,
+            gcs_uri=analysis_data["gcs_uri"],
             status=status,
-            confidence_score=score
+            confidence_score=score,
+            thumbnail_uris=analysis_data.get("thumbnail_uris"),
         )
         
     return ImageAnalysisResponse(
-        gcs_uri=gcs_uri,
+        gcs_uri=analysis_data["gcs_uri"],
         status=status,
         suggested_title=analysis_data.get("suggested_title"),
         seo_tags=analysis_data.get("seo_tags"),
@@ -78,7 +141,133 @@ async def analyze_image(image_file: UploadFile = File(...)):
         primary_colors=analysis_data.get("primary_colors"),
         estimated_dimensions_cm=analysis_data.get("estimated_dimensions_cm"),
         confidence_score=score,
+        thumbnail_uris=analysis_data.get("thumbnail_uris"),
+    )
+
+async def spool(image_file: UploadFile) -> upload_utils.SpooledUpload:
+    # Read in chunks and hash as we go; large photos spool to disk instead of RAM
+    return await upload_utils.spool_upload(
+        image_file,
+        max_bytes=settings.UPLOAD_MAX_BYTES,
+        chunk_size=settings.UPLOAD_READ_CHUNK_BYTES,
+        spool_threshold=settings.UPLOAD_SPOOL_THRESHOLD_BYTES,
+    )
+
+@router.post("/analyze", response_model=ImageAnalysisResponse)
+async def analyze_image(image_file: UploadFile = File(...)):
+    """Orchestrates the new, enhanced image analysis flow."""
+    try:
+        upload = await spool(image_file)
+    except upload_utils.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    analysis_data = await analyze_spooled_upload(upload, image_file.filename.split('.')[-1])
+    return build_analysis_response(analysis_data)
+
+
+def _ranked(values_by_image: List[tuple], limit: int) -> List[str]:
+    """Values ordered by summed confidence of the images that mention them, then first appearance."""
+    weights: Dict[str, float] = {}
+    for values, weight in values_by_image:
+        for value in dict.fromkeys(values or []):
+            weights[value] = weights.get(value, 0.0) + weight
+    return sorted(weights, key=lambda value: -weights[value])[:limit]
+
+def merge_analyses(analyses: List[dict]) -> dict:
+    """
+    Merges per-photo attributes into one listing suggestion. The title and dimensions come
+    from the most confident photo; tags, materials and colours are ranked across all photos.
+    """
+    usable = [a for a in analyses if analysis_status(a.get("confidence_score", 0.0)) != "rejected"]
+    if not usable:
+        return {"status": "rejected", "confidence_score": max((a.get("confidence_score", 0.0) for a in analyses), default=0.0)}
+
+    usable.sort(key=lambda a: a.get("confidence_score", 0.0), reverse=True)
+    best = usable[0]
+    score = sum(a.get("confidence_score", 0.0) for a in usable) / len(usable)
+    dimensions = next(
+        (a["estimated_dimensions_cm"] for a in usable if a.get("estimated_dimensions_cm") not in (None, "N/A")),
+        "N/A",
     )
+    return {
+        "status": analysis_status(score),
+        "suggested_title": best.get("suggested_title"),
+        "seo_tags": _ranked([(a.get("seo_tags"), a.get("confidence_score", 0.0)) for a in usable], 8),
+        "suggested_materials": _ranked([(a.get("suggested_materials"), a.get("confidence_score", 0.0)) for a in usable], 8),
+        "primary_colors": _ranked([(a.get("primary_colors"), a.get("confidence_score", 0.0)) for a in usable], 3),
+        "estimated_dimensions_cm": dimensions,
+        "confidence_score": score,
+    }
+
+@router.post(
+    "/analyze/batch",
+    summary="Analyse Several Photos of One Product",
+    description=(
+        "Streams NDJSON: an `image` event per photo as soon as its analysis is ready (or `image_error`), "
+        "then `done` with the merged `listing` suggestion and the image URIs in upload order."
+    ),
+)
+async def analyze_images_batch(image_files: List[UploadFile] = File(...)):
+    if len(image_files) > settings.COPILOT_BATCH_MAX_IMAGES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.COPILOT_BATCH_MAX_IMAGES} images per request."
+        )
+
+    # Spool everything before streaming starts, while the request's files are still open
+    uploads = {}
+    errors = {}
+    for index, image_file in enumerate(image_files):
+        try:
+            uploads[index] = await spool(image_file)
+        except upload_utils.UploadTooLarge as e:
+            errors[index] = str(e)
+
+    async def events():
+        for index, detail in errors.items():
+            yield {"event": "image_error", "index": index, "filename": image_files[index].filename, "detail": detail}
+
+        semaphore = asyncio.Semaphore(settings.COPILOT_BATCH_CONCURRENCY)
+
+        async def analyze(index: int) -> tuple:
+            # Multi-photo listings queue behind single-photo interactive requests
+            with scheduling(Priority.BATCH, settings.SCHEDULER_BATCH_BUDGET_S):
+                async with semaphore:
+                    try:
+                        analysis = await analyze_spooled_upload(uploads.pop(index), image_files[index].filename.split('.')[-1])
+                    except Exception as e:
+                        return index, None, getattr(e, "detail", str(e))
+            return index, analysis, None
+
+        tasks = [asyncio.create_task(analyze(index)) for index in list(uploads)]
+        analyses = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, analysis, detail = await next_done
+                if analysis is None:
+                    yield {"event": "image_error", "index": index, "filename": image_files[index].filename, "detail": detail}
+                    continue
+                analyses[index] = analysis
+                yield {
+                    "event": "image",
+                    "index": index,
+                    "filename": image_files[index].filename,
+                    **build_analysis_response(analysis).model_dump(),
+                }
+        finally:
+            # Client went away: stop queued photos and drop their spooled files
+            for task in tasks:
+                task.cancel()
+            for upload in uploads.values():
+                upload.close()
+
+        yield {
+            "event": "done",
+            "listing": merge_analyses(list(analyses.values())),
+            "gcs_uris": [analyses[index]["gcs_uri"] for index in sorted(analyses)],
+        }
+
+    return ndjson_response(events())
 
 
 #image enhancement endpoint
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, status
-from app.schemas.pricing import PriceSuggestionRequest, PriceSuggestionResponse
+from app.schemas.pricing import PriceSuggestionRequest, PriceSuggestionResponse, BatchPriceSuggestionRequest
 from app.models.price_model import price_suggestion_service
+from app.utils.scheduler import QuotaExceeded
+from app.utils.streaming import ndjson_response
 
 router = APIRouter()
 
@@ -8,9 +10,20 @@ router = APIRouter()
     "/suggest",
     response_model=PriceSuggestionResponse,
     summary="Suggest a Price for an Artisan's Product",
+    description=(
+        "With `stream=true` the response is NDJSON: a `price` event as soon as the range is computed, "
+        "`explanation` events with text deltas, then `done` with the full explanation."
+    ),
     tags=["Pricing"]
 )
-async def suggest_product_price(request: PriceSuggestionRequest):
+async def suggest_product_price(request: PriceSuggestionRequest, stream: bool = False):
+    if stream:
+        return ndjson_response(price_suggestion_service.stream_suggestion(
+            materials_cost=request.materials_cost,
+            labor_hours=request.labor_hours,
+            category=request.category
+        ))
+
     try:
         suggestion = await price_suggestion_service.suggest_price(
             materials_cost=request.materials_cost,
@@ -18,8 +31,25 @@ async def suggest_product_price(request: PriceSuggestionRequest):
             category=request.category
         )
         return suggestion
+    except QuotaExceeded:
+        raise  # answered with 429 by the app's handler
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {e}"
-        )
\ No newline at end of file
+        )
+
+
+@router.post(
+    "/suggest/batch",
+    summary="Suggest Prices for Many Products at Once",
+    description=(
+        "Streams NDJSON: one `item` event per product (with its `index` and `item_id`) as soon as its "
+        "explanation is ready, `item_error` when only the explanation failed, then a final `done` event."
+    ),
+    tags=["Pricing"]
+)
+async def suggest_product_prices_batch(request: BatchPriceSuggestionRequest):
+    return ndjson_response(price_suggestion_service.suggest_prices_batch(
+        [item.model_dump() for item in request.items]
+    ))
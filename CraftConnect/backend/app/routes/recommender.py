@@ -1,5 +1,8 @@
 from fastapi import APIRouter, HTTPException, status
-from app.schemas.recommender import RecommendationResponse, RecommendedProduct
+from app.schemas.recommender import (
+    RecommendationResponse, RecommendedProduct,
+    BatchRecommendationRequest, BatchRecommendationResponse,
+)
 from app.models.recommender_model import recommender_service
 
 router = APIRouter()
@@ -24,4 +27,29 @@ async def get_similar_products(product_id: str, fairness: bool = False):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
             detail=f"An error occurred: {e}"
+        )
+
+
+@router.post(
+    "/products/similar/batch",
+    response_model=BatchRecommendationResponse,
+    summary="Get Similar Products for Many Products in One Call",
+    tags=["Recommendations"]
+)
+async def get_similar_products_batch(request: BatchRecommendationRequest):
+    try:
+        results = await recommender_service.get_recommendations_batch(
+            product_ids=request.product_ids,
+            fairness_boost=request.fairness
+        )
+
+        return BatchRecommendationResponse(results={
+            pid: [RecommendedProduct(**data) for data in recs]
+            for pid, recs in results.items()
+        })
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred: {e}"
         )
\ No newline at end of file
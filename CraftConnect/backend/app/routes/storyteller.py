@@ -3,20 +3,40 @@ import logging
 
 from app.models.vertex_text import vertex_text_client
 from app.schemas.story import StoryRequest, StoryResponse
+from app.utils.scheduler import QuotaExceeded
+from app.utils.streaming import ndjson_response
 
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+
+async def stream_story_events(request: StoryRequest, use_cache: bool = True):
+    parts = []
+    async for delta in vertex_text_client.stream_story(
+        artisan_heritage=request.artisan_heritage,
+        piece_story=request.piece_story,
+        use_cache=use_cache
+    ):
+        parts.append(delta)
+        yield {"event": "story", "delta": delta}
+    yield {"event": "done", "generated_story": "".join(parts).strip()}
+
 @router.post(
     "/generate",
     response_model=StoryResponse,
     summary="Generate a Polished Product Story",
-    description="Takes an artisan's heritage and a piece-specific story and uses Gemini to generate a cohesive narrative.",
+    description=(
+        "Takes an artisan's heritage and a piece-specific story and uses Gemini to generate a cohesive narrative. "
+        "With `stream=true` the response is NDJSON: `story` events with text deltas as they are generated, "
+        "then `done` with the full story. Pass `cache=false` to always generate a fresh story."
+    ),
     tags=["Storyteller"]
 )
 async def generate_story(
-    request: StoryRequest = Body(...)
+    request: StoryRequest = Body(...),
+    stream: bool = False,
+    cache: bool = True
 ) -> StoryResponse:
     """
     Generates a product story by combining two prompts using the Vertex AI Gemini model.
@@ -33,13 +53,19 @@ async def generate_story(
             detail="Both artisan_heritage and piece_story fields are required."
         )
 
+    if stream:
+        return ndjson_response(stream_story_events(request, use_cache=cache))
+
     try:
         polished_story = await vertex_text_client.generate_story_from_prompts(
             artisan_heritage=request.artisan_heritage,
-            piece_story=request.piece_story
+            piece_story=request.piece_story,
+            use_cache=cache
         )
         return StoryResponse(generated_story=polished_story)
         
+    except QuotaExceeded:
+        raise  # answered with 429 by the app's handler
     except Exception as e:
         logger.error(f"Failed to generate story: {e}", exc_info=True)
         raise HTTPException(
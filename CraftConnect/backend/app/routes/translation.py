@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException, status, Body
 import logging
 
-from app.schemas.translation import TranslationRequest, TranslationResponse
+from app.schemas.translation import TranslationRequest, TranslationResponse, BatchTranslationRequest, BatchTranslationResponse
 from app.models.translation_model import translation_service_client
 from app.config.settings import settings
+from app.utils.scheduler import QuotaExceeded
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -29,9 +30,46 @@ async def translate_text_with_qa(request: TranslationRequest = Body(...)):
             quality_score=result["quality_score"],
             is_quality_ok=is_quality_ok,
         )
+    except QuotaExceeded:
+        raise  # answered with 429 by the app's handler
     except Exception as e:
         logger.error(f"Failed during translation QA: {e}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Translation service is currently unavailable."
-        )
\ No newline at end of file
+        )
+
+
+@router.post(
+    "/translate/batch",
+    response_model=BatchTranslationResponse,
+    summary="Translate Many Texts into Many Languages with QA",
+    tags=["Translation"]
+)
+async def translate_texts_batch_with_qa(request: BatchTranslationRequest = Body(...)):
+    try:
+        results = await translation_service_client.translate_batch_with_qa(
+            texts=request.texts,
+            target_language_codes=list(dict.fromkeys(request.target_language_codes)),
+            artisan_id=request.artisan_id,
+        )
+
+        return BatchTranslationResponse(results=[
+            {
+                language: TranslationResponse(
+                    translated_text=result["translated_text"],
+                    quality_score=result["quality_score"],
+                    is_quality_ok=result["quality_score"] >= settings.TRANSLATION_QA_THRESHOLD,
+                )
+                for language, result in by_language.items()
+            }
+            for by_language in results
+        ])
+    except QuotaExceeded:
+        raise  # answered with 429 by the app's handler
+    except Exception as e:
+        logger.error(f"Failed during batch translation QA: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Translation service is currently unavailable."
+        )
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from typing import List, Optional
 
 class PriceSuggestionRequest(BaseModel):
     materials_cost: float = Field(..., gt=0, description="Cost of raw materials in INR.")
@@ -10,4 +11,10 @@ class PriceSuggestionResponse(BaseModel):
     max_price: float
     suggested_price: float
     explanation: str = Field(..., description="AI-generated explanation for the price range.")
-    confidence: str = Field(..., description="The confidence level of the suggestion (Low, Medium, High).")
\ No newline at end of file
+    confidence: str = Field(..., description="The confidence level of the suggestion (Low, Medium, High).")
+
+class BatchPriceSuggestionItem(PriceSuggestionRequest):
+    item_id: Optional[str] = Field(None, description="Caller's reference, echoed back on the result line.")
+
+class BatchPriceSuggestionRequest(BaseModel):
+    items: List[BatchPriceSuggestionItem] = Field(..., min_length=1, max_length=1000)
\ No newline at end of file
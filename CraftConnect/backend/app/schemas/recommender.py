@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List
 
 class RecommendedProduct(BaseModel):
     id: str
@@ -8,4 +8,11 @@ class RecommendedProduct(BaseModel):
     explanation: str = Field(..., description="AI-generated reason for the recommendation.")
 
 class RecommendationResponse(BaseModel):
-    products: List[RecommendedProduct]
\ No newline at end of file
+    products: List[RecommendedProduct]
+
+class BatchRecommendationRequest(BaseModel):
+    product_ids: List[str] = Field(..., min_length=1, max_length=100, description="Products to find similar items for.")
+    fairness: bool = False
+
+class BatchRecommendationResponse(BaseModel):
+    results: Dict[str, List[RecommendedProduct]] = Field(..., description="Similar products keyed by the requested product ID.")
\ No newline at end of file
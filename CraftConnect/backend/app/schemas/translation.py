@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, List, Optional
 
 class TranslationRequest(BaseModel):
     """ Defines the input for a translation request. """
@@ -11,4 +11,14 @@ class TranslationResponse(BaseModel):
     """ Defines the output of a translation with its quality score. """
     translated_text: str
     quality_score: float
-    is_quality_ok: bool
\ No newline at end of file
+    is_quality_ok: bool
+
+class BatchTranslationRequest(BaseModel):
+    """ Many texts translated into many languages in one call, e.g. a listing localised for every market. """
+    texts: List[str] = Field(..., min_length=1, max_length=100, description="The source texts to be translated.")
+    target_language_codes: List[str] = Field(..., min_length=1, max_length=12, examples=[["hi", "ta", "bn"]])
+    artisan_id: Optional[str] = Field(None, description="Optional ID of the artisan to use their custom glossary.")
+
+class BatchTranslationResponse(BaseModel):
+    """ One entry per input text, in order, keyed by target language code. """
+    results: List[Dict[str, TranslationResponse]]
\ No newline at end of file
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.utils.scheduler import Priority, current_claim, scheduling_for
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item calls into batched calls.
+
+    Callers `await submit(item)`. Items queue up until either `max_batch_size`
+    items are waiting, their summed `weight(item)` would pass `max_batch_weight`
+    (e.g. a per-request token limit), or `max_wait_ms` has passed since the first one
+    arrived, then `process_batch(items)` runs once for all of them. An item heavier
+    than the limit on its own is sent alone. It must return one
+    result per item, in order; an Exception instance in that list is raised
+    only to the caller that submitted the matching item.
+
+    Callers at different scheduler priorities never share a batch, and each batch's
+    backend calls are scheduled for its own callers (most urgent priority, earliest
+    deadline) rather than for whichever caller happened to flush it.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_concurrent_batches: Optional[int] = None,
+        max_batch_weight: Optional[float] = None,
+        weight: Optional[Callable[[Any], float]] = None,
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_batch_weight = max_batch_weight
+        self.weight = weight or (lambda item: 1)
+        self.max_wait_s = max_wait_ms / 1000
+        self.max_concurrent_batches = max_concurrent_batches
+        # Per priority: (item, future, (priority, deadline)) waiting for the next batch
+        self._pending: Dict[Priority, List[Tuple[Any, asyncio.Future, tuple]]] = {}
+        self._timers: Dict[Priority, asyncio.TimerHandle] = {}
+        self._weights: Dict[Priority, float] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        claim = current_claim()
+        priority = claim[0]
+        item_weight = self.weight(item) if self.max_batch_weight else 0
+        if priority in self._pending and self._weights[priority] + item_weight > (self.max_batch_weight or float("inf")):
+            # This item would push the batch over its size budget: send what is queued first
+            self._flush(priority)
+        pending = self._pending.setdefault(priority, [])
+        pending.append((item, future, claim))
+        self._weights[priority] = self._weights.get(priority, 0) + item_weight
+
+        if len(pending) >= self.max_batch_size or self._weights[priority] >= (self.max_batch_weight or float("inf")):
+            self._flush(priority)
+        elif priority not in self._timers:
+            self._timers[priority] = loop.call_later(self.max_wait_s, self._flush, priority)
+        return await future
+
+    def _flush(self, priority: Priority):
+        timer = self._timers.pop(priority, None)
+        if timer is not None:
+            timer.cancel()
+
+        pending = self._pending.pop(priority, [])
+        self._weights.pop(priority, None)
+        for start in range(0, len(pending), self.max_batch_size):
+            batch = pending[start:start + self.max_batch_size]
+            task = asyncio.ensure_future(self._run(batch))
+            # Keep a reference so the task is not garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future, tuple]]):
+        if self.max_concurrent_batches and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+
+        items = [item for item, _, _ in batch]
+        claims = [claim for _, _, claim in batch]
+        try:
+            with scheduling_for(claims):
+                if self._semaphore is not None:
+                    async with self._semaphore:
+                        results = await self.process_batch(items)
+                else:
+                    results = await self.process_batch(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(items)} items.")
+        except Exception as e:
+            logger.error(f"Batch of {len(items)} items failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():  # caller was cancelled
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
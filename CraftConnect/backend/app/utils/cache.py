@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+from app.utils.metrics import metrics
+from app.utils.scheduler import current_claim, scheduling_for
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded in-process LRU cache with an optional time-to-live.
+    Hits and misses are counted under `cache.<name>.*` in the metrics registry.
+    """
+
+    def __init__(self, max_size: int, ttl_s: Optional[float] = None, name: str = "default"):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    metrics.incr(f"cache.{self.name}.hits")
+                    return value
+                del self._data[key]
+        metrics.incr(f"cache.{self.name}.misses")
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl_s: Optional[float] = None):
+        ttl_s = ttl_s if ttl_s is not None else self.ttl_s
+        expires_at = time.monotonic() + ttl_s if ttl_s else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                metrics.incr(f"cache.{self.name}.evictions")
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteStore:
+    """
+    Persistent key -> bytes store backed by a single SQLite file.
+    Calls are blocking; run them in the thread pool from async code.
+
+    Bounded when max_rows or max_age_s is set (0 = unbounded): rows older than max_age_s
+    are never returned, and on open and every prune_every written rows the expired rows
+    and then the oldest rows beyond max_rows are deleted.
+    """
+
+    def __init__(self, path: str, table: str = "entries", max_rows: int = 0, max_age_s: float = 0,
+                 prune_every: int = 1000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.table = table
+        self.max_rows = max_rows
+        self.max_age_s = max_age_s
+        self.prune_every = prune_every
+        self._writes_since_prune = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_created_at ON {table} (created_at)")
+        self._conn.commit()
+        with self._lock:
+            self._prune()
+
+    def _oldest_allowed(self) -> float:
+        return time.time() - self.max_age_s if self.max_age_s > 0 else float("-inf")
+
+    def _prune(self):
+        """Deletes expired rows, then the oldest rows beyond max_rows. Call with the lock held."""
+        deleted = 0
+        if self.max_age_s > 0:
+            deleted += self._conn.execute(
+                f"DELETE FROM {self.table} WHERE created_at < ?", (self._oldest_allowed(),)
+            ).rowcount
+        if self.max_rows > 0:
+            (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+            if count > self.max_rows:
+                deleted += self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY created_at LIMIT ?)",
+                    (count - self.max_rows,),
+                ).rowcount
+        self._conn.commit()
+        self._writes_since_prune = 0
+        if deleted:
+            metrics.incr(f"sqlite_store.{self.table}.pruned", deleted)
+            logger.info(f"Pruned {deleted} rows from the '{self.table}' store.")
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders}) AND created_at >= ?",
+                    [*chunk, self._oldest_allowed()],
+                )
+                found.update(rows)
+        return found
+
+    def set_many(self, items: Dict[str, bytes]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in items.items()],
+            )
+            self._conn.commit()
+            self._writes_since_prune += len(items)
+            if (self.max_rows > 0 or self.max_age_s > 0) and self._writes_since_prune >= self.prune_every:
+                self._prune()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one in-flight task, so a burst of
+    identical misses costs one backend call. Cancelling one waiter does not cancel the
+    shared work for the others. Backend calls inside the shared work are scheduled for
+    the most urgent of its waiters, including ones that join after it started.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._claims: Dict[Hashable, list] = {}
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Returns the in-flight task for key, starting fn() if there is none."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self._claims[key].append(current_claim())
+            return task
+
+        claims = [current_claim()]
+
+        async def run():
+            with scheduling_for(claims):
+                return await fn()
+
+        task = asyncio.ensure_future(run())
+        self._inflight[key] = task
+        self._claims[key] = claims
+
+        def _forget(done: asyncio.Task):
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+                del self._claims[key]
+        task.add_done_callback(_forget)
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        return await asyncio.shield(self.start(key, fn))
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
@@ -0,0 +1,413 @@
+import json
+import logging
+import math
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+METRICS = {
+    "l2": faiss.METRIC_L2,
+    "ip": faiss.METRIC_INNER_PRODUCT,
+    "cosine": faiss.METRIC_INNER_PRODUCT,  # inner product over L2-normalised vectors
+}
+
+# Files inside one versioned index directory
+INDEX_FILE = "index.faiss"
+IDS_FILE = "ids.npy"
+META_FILE = "meta.json"
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+IDS_SORTED_FILE = "ids_sorted.npy"
+LABELS_SORTED_FILE = "labels_sorted.npy"
+NEIGHBORS_FILE = "neighbors.npy"
+NEIGHBOR_DISTANCES_FILE = "neighbor_distances.npy"
+# Pointer file in the index root naming the live version
+CURRENT_FILE = "CURRENT"
+
+# FAISS wants roughly 39 training points per centroid before it stops warning.
+MIN_POINTS_PER_CENTROID = 39
+
+
+def prepare_vectors(vectors, metric: str) -> np.ndarray:
+    """Returns a contiguous float32 matrix, L2-normalised when the metric is cosine."""
+    matrix = np.ascontiguousarray(np.asarray(vectors, dtype="float32"))
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if metric == "cosine":
+        matrix = matrix.copy()
+        faiss.normalize_L2(matrix)
+    return matrix
+
+
+def _choose_nlist(num_vectors: int, requested: int) -> int:
+    nlist = requested or int(4 * math.sqrt(num_vectors))
+    return max(1, min(nlist, num_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def _factory_string(index_type: str, num_vectors: int, dimension: int, params: dict) -> str:
+    """Maps an index type to a faiss.index_factory description, degrading when the catalogue is too small to train."""
+    if index_type == "hnsw":
+        return f"HNSW{params['hnsw_m']}"
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        if num_vectors < MIN_POINTS_PER_CENTROID:
+            logger.warning(f"Only {num_vectors} vectors, too few to train an IVF index. Falling back to a flat index.")
+            return "Flat"
+        nlist = _choose_nlist(num_vectors, params["nlist"])
+
+        if index_type == "ivf_pq":
+            pq_m, nbits = params["pq_m"], params["pq_nbits"]
+            min_pq_points = (1 << nbits) * MIN_POINTS_PER_CENTROID
+            if dimension % pq_m != 0:
+                logger.warning(f"PQ m={pq_m} does not divide dimension {dimension}. Falling back to IVF-Flat.")
+            elif num_vectors < min_pq_points:
+                logger.warning(f"IVF-PQ needs at least {min_pq_points} vectors to train. Falling back to IVF-Flat.")
+            else:
+                return f"IVF{nlist},PQ{pq_m}x{nbits}"
+        return f"IVF{nlist},Flat"
+
+    return "Flat"
+
+
+def unwrap_index(index):
+    """Strips ID-map and pre-transform wrappers to reach the index that owns the search knobs."""
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexPreTransform)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def stores_ids_natively(factory: str) -> bool:
+    """IVF indexes add and remove vectors by label themselves; everything else needs an IndexIDMap2."""
+    return factory.startswith("IVF")
+
+
+def build_index(
+    embeddings,
+    labels=None,
+    index_type: str = "flat",
+    metric: str = "cosine",
+    nlist: int = 0,
+    pq_m: int = 64,
+    pq_nbits: int = 8,
+    hnsw_m: int = 32,
+    hnsw_ef_construction: int = 200,
+):
+    """
+    Builds, trains and fills a FAISS index keyed by label for the given embedding matrix.
+
+    Row i is stored under labels[i] (0..n-1 when no labels are given), so later
+    incremental runs can remove and re-add individual products.
+
+    Returns the index together with a metadata dict that has to be persisted
+    next to it, so the search side knows how to prepare query vectors.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown FAISS metric '{metric}'. Expected one of {tuple(METRICS)}.")
+
+    matrix = prepare_vectors(embeddings, metric)
+    num_vectors, dimension = matrix.shape
+    if labels is None:
+        labels = np.arange(num_vectors, dtype="int64")
+
+    params = {"nlist": nlist, "pq_m": pq_m, "pq_nbits": pq_nbits, "hnsw_m": hnsw_m}
+    description = _factory_string(index_type, num_vectors, dimension, params)
+    inner = faiss.index_factory(dimension, description, METRICS[metric])
+
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efConstruction = hnsw_ef_construction
+
+    if not inner.is_trained:
+        logger.info(f"Training '{description}' index on {num_vectors} vectors...")
+        inner.train(matrix)
+
+    if stores_ids_natively(description):
+        # IVF lists keep their own ids and never renumber on removal, which is what an
+        # IDMap wrapper assumes; wrapping them corrupts the mapping after the first delete
+        index = inner
+    else:
+        index = faiss.IndexIDMap2(inner)
+    index.add_with_ids(matrix, np.asarray(labels, dtype="int64"))
+
+    meta = {
+        "index_type": index_type,
+        "factory": description,
+        "metric": metric,
+        "dimension": dimension,
+        "ntotal": int(index.ntotal),
+        "id_mapped": True,
+        "native_ids": stores_ids_natively(description),
+        "mmap_mode": mmap_mode(description),
+    }
+    logger.info(f"Built FAISS index '{description}' ({metric}) with {index.ntotal} vectors.")
+    return index, meta
+
+
+def supports_removal(index) -> bool:
+    """HNSW graphs cannot drop vectors, so they always need a full rebuild for updates and deletes."""
+    return not hasattr(unwrap_index(index), "hnsw")
+
+
+def apply_delta(index, metric: str, remove_labels, add_embeddings, add_labels):
+    """Removes and (re-)adds vectors by label, in place, on an IndexIDMap2-wrapped or IVF index."""
+    if len(remove_labels):
+        removed = index.remove_ids(np.asarray(remove_labels, dtype="int64"))
+        logger.info(f"Removed {removed} vectors from the index.")
+    if len(add_labels):
+        index.add_with_ids(prepare_vectors(add_embeddings, metric), np.asarray(add_labels, dtype="int64"))
+        logger.info(f"Added {len(add_labels)} vectors to the index.")
+
+
+def set_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Applies query-time knobs. Settings that do not apply to the index type are ignored."""
+    inner = unwrap_index(index)
+    if nprobe and hasattr(inner, "nprobe"):
+        inner.nprobe = min(nprobe, inner.nlist)
+    if ef_search and hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = ef_search
+
+
+def write_manifest(manifest: dict, manifest_path: str):
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+
+
+def read_manifest(manifest_path: str) -> Optional[dict]:
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_meta(meta: dict, meta_path: str):
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def read_meta(meta_path: str) -> dict:
+    """Reads index metadata. Indexes built before metadata existed were always flat L2."""
+    if not os.path.exists(meta_path):
+        return {"index_type": "flat", "factory": "Flat", "metric": "l2"}
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# --- Versioned index directories ---------------------------------------------
+#
+# <root>/
+#   CURRENT                  name of the live version, replaced atomically
+#   v20250101T020000Z/
+#     index.faiss
+#     ids.npy                fixed-width UTF-8 product IDs, row i -> FAISS label i ("" = deleted)
+#     ids_sorted.npy         ids.npy sorted, with labels_sorted.npy: product_id -> label by binary search
+#     labels_sorted.npy
+#     vectors.npy            raw float32 embeddings, row i = label i (zeros for deleted labels)
+#     neighbors.npy          int32 top-K neighbour labels of label i, self excluded (-1 = none)
+#     neighbor_distances.npy float32 distances matching neighbors.npy
+#     meta.json
+#     manifest.json          product_id -> [label, content hash], read by incremental runs
+
+
+def new_version_dir(root: str) -> str:
+    """Creates an empty directory for a new index version and returns its path."""
+    version = datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S%fZ")
+    path = os.path.join(root, version)
+    os.makedirs(path)
+    return path
+
+
+def write_ids(product_ids: List[str], version_dir: str):
+    """
+    Stores product IDs as a compact fixed-width byte-string array that can be memory-mapped,
+    plus a sorted copy and its labels for product_id -> label lookups.
+    """
+    ids = np.array([pid.encode("utf-8") for pid in product_ids], dtype=bytes)
+    order = np.argsort(ids, kind="stable")
+    np.save(os.path.join(version_dir, IDS_FILE), ids)
+    np.save(os.path.join(version_dir, IDS_SORTED_FILE), ids[order])
+    np.save(os.path.join(version_dir, LABELS_SORTED_FILE), order.astype("int64"))
+
+
+def _search_neighbor_rows(index, vectors: np.ndarray, labels: np.ndarray, metric: str, k: int, batch_size: int,
+                          neighbors: np.ndarray, distances: np.ndarray):
+    """Fills the neighbour table rows of the given labels in place."""
+    faiss.omp_set_num_threads(os.cpu_count() or 1)
+    for start in range(0, len(labels), batch_size):
+        rows = labels[start:start + batch_size]
+        found_distances, found_labels = index.search(prepare_vectors(vectors[rows], metric), k + 1)
+        # Push each row's own label to the end (stable, so the ranking is kept), then drop it
+        is_self = found_labels == rows[:, None]
+        order = np.argsort(is_self, axis=1, kind="stable")[:, :k]
+        neighbors[rows] = np.take_along_axis(found_labels, order, axis=1)
+        distances[rows] = np.take_along_axis(found_distances, order, axis=1)
+
+
+def compute_neighbor_table(index, vectors: np.ndarray, live_labels, metric: str, k: int, batch_size: int = 4096):
+    """
+    Searches every live vector against the index in large batches (FAISS spreads each
+    batch over all cores) and returns (neighbors int32, distances float32), both shaped
+    (len(vectors), k). Rows of deleted labels stay -1 / inf.
+    """
+    live_labels = np.asarray(live_labels, dtype="int64")
+    neighbors = np.full((len(vectors), k), -1, dtype="int32")
+    distances = np.full((len(vectors), k), np.inf, dtype="float32")
+    _search_neighbor_rows(index, vectors, live_labels, metric, k, batch_size, neighbors, distances)
+
+    logger.info(f"Computed top-{k} neighbour table for {len(live_labels)} products.")
+    return neighbors, distances
+
+
+def _rows_beaten_by(vectors: np.ndarray, rows: np.ndarray, kth: np.ndarray, queries: np.ndarray,
+                    metric: str, batch_size: int) -> np.ndarray:
+    """For each row, whether any query vector is closer to it than its current k-th neighbour."""
+    beaten = np.zeros(len(rows), dtype=bool)
+    for start in range(0, len(rows), batch_size):
+        block = prepare_vectors(vectors[rows[start:start + batch_size]], metric)
+        block_kth = kth[start:start + batch_size, None]
+        for q_start in range(0, len(queries), batch_size):
+            q = queries[q_start:q_start + batch_size]
+            if metric == "l2":
+                # Squared L2, the unit FAISS reports; smaller is closer
+                d = (block ** 2).sum(axis=1)[:, None] + (q ** 2).sum(axis=1)[None, :] - 2 * block @ q.T
+                beaten[start:start + batch_size] |= (d < block_kth).any(axis=1)
+            else:
+                beaten[start:start + batch_size] |= (block @ q.T > block_kth).any(axis=1)
+    return beaten
+
+
+def update_neighbor_table(index, vectors: np.ndarray, live_labels, metric: str, k: int,
+                          previous_neighbors: np.ndarray, previous_distances: np.ndarray,
+                          changed_labels, stale_labels, batch_size: int = 4096):
+    """
+    Incremental counterpart of compute_neighbor_table after a delta. Copies the previous
+    table and re-searches only the rows that can differ: changed or added labels, rows
+    that list a removed or updated label, rows with free slots, and rows for which a
+    changed vector is closer than their current k-th neighbour. Work is proportional
+    to the delta times the catalogue, instead of the whole catalogue searched again.
+    """
+    live_labels = np.asarray(live_labels, dtype="int64")
+    changed_labels = np.asarray(changed_labels, dtype="int64")
+    neighbors = np.full((len(vectors), k), -1, dtype="int32")
+    distances = np.full((len(vectors), k), np.inf, dtype="float32")
+    carried = min(len(previous_neighbors), len(vectors))
+    neighbors[:carried] = previous_neighbors[:carried]
+    distances[:carried] = previous_distances[:carried]
+
+    is_live = np.zeros(len(vectors), dtype=bool)
+    is_live[live_labels] = True
+    neighbors[~is_live] = -1
+    distances[~is_live] = np.inf
+
+    affected = np.zeros(len(vectors), dtype=bool)
+    affected[changed_labels] = True
+    if len(stale_labels):
+        affected[live_labels] |= np.isin(neighbors[live_labels], np.asarray(stale_labels)).any(axis=1)
+    if len(changed_labels):
+        affected[live_labels] |= neighbors[live_labels, -1] < 0
+        queries = prepare_vectors(vectors[changed_labels], metric)
+        candidates = live_labels[~affected[live_labels]]
+        affected[candidates] |= _rows_beaten_by(
+            vectors, candidates, distances[candidates, -1], queries, metric, batch_size
+        )
+    affected &= is_live
+
+    rows = np.flatnonzero(affected).astype("int64")
+    _search_neighbor_rows(index, vectors, rows, metric, k, batch_size, neighbors, distances)
+    logger.info(f"Updated top-{k} neighbour table: {len(rows)} of {len(live_labels)} rows re-searched.")
+    return neighbors, distances
+
+
+def write_neighbor_table(neighbors: np.ndarray, distances: np.ndarray, version_dir: str):
+    np.save(os.path.join(version_dir, NEIGHBORS_FILE), neighbors)
+    np.save(os.path.join(version_dir, NEIGHBOR_DISTANCES_FILE), distances)
+
+
+def write_vectors(vectors: np.ndarray, version_dir: str):
+    np.save(os.path.join(version_dir, VECTORS_FILE), np.asarray(vectors, dtype="float32"))
+
+
+def load_ids(path: str, mmap: bool = True) -> np.ndarray:
+    return np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+
+
+def load_array(path: str, mmap: bool = True) -> Optional[np.ndarray]:
+    """Loads an optional .npy file of a version, or None when an older version does not have it."""
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+
+
+def lookup_label(ids_sorted: np.ndarray, labels_sorted: np.ndarray, product_id: str) -> int:
+    """Binary-searches the sorted ID table. Returns -1 when the product is not in the index."""
+    key = product_id.encode("utf-8")
+    if len(key) > ids_sorted.dtype.itemsize:
+        return -1
+    pos = int(np.searchsorted(ids_sorted, key))
+    if pos < len(ids_sorted) and ids_sorted[pos] == key:
+        return int(labels_sorted[pos])
+    return -1
+
+
+def mmap_mode(factory: str) -> str:
+    """
+    How an index of this factory type is memory-mapped. IO_FLAG_MMAP only maps IVF
+    inverted lists; flat code arrays (Flat, HNSW storage) need IO_FLAG_MMAP_IFC, or
+    every worker gets a private copy of the vectors.
+    """
+    return "inverted_lists" if stores_ids_natively(factory) else "codes"
+
+
+def read_index(path: str, mmap: bool = True, factory: str = "Flat"):
+    """Loads an index, memory-mapping it read-only so workers share pages through the OS cache."""
+    if mmap:
+        mode = mmap_mode(factory)
+        flag = faiss.IO_FLAG_MMAP if mode == "inverted_lists" else getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+        if flag is None:
+            logger.warning(f"This faiss build cannot memory-map flat codes. Loading '{path}' into memory instead.")
+        else:
+            try:
+                index = faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+                logger.info(f"Memory-mapped '{path}' ({factory}, mmap_mode={mode}).")
+                return index
+            except RuntimeError as e:
+                logger.warning(f"Could not memory-map '{path}' ({e}). Loading it into memory instead.")
+    return faiss.read_index(path)
+
+
+def publish_version(root: str, version_dir: str):
+    """Points CURRENT at a fully written version directory in a single atomic rename."""
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_dir))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def current_version(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def prune_versions(root: str, keep: int):
+    """Deletes all but the newest `keep` versions. The live version is never removed."""
+    live = current_version(root)
+    versions = sorted(
+        name for name in os.listdir(root)
+        if name.startswith("v") and os.path.isdir(os.path.join(root, name))
+    )
+    for name in versions[:-keep] if keep > 0 else versions:
+        if name != live:
+            # Workers that still map these files keep them alive until they swap
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -1,5 +1,15 @@
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Sequence, Union
+import asyncio
 import io
+import multiprocessing
+from app.config.settings import settings
+
+WEBP_CONTENT_TYPE = "image/webp"
+
+# Pillow work is CPU-bound and holds the GIL, so it runs in worker processes
+_process_pool: Optional[ProcessPoolExecutor] = None
 
 def local_enhance_image(image_bytes: bytes) -> bytes:
     """
@@ -19,4 +29,68 @@ def local_enhance_image(image_bytes: bytes) -> bytes:
     # Save the enhanced image back to bytes
     byte_arr = io.BytesIO()
     img.save(byte_arr, format='PNG')
-    return byte_arr.getvalue()
\ No newline at end of file
+    return byte_arr.getvalue()
+
+
+def _encode_webp(img: Image.Image, quality: int) -> bytes:
+    byte_arr = io.BytesIO()
+    img.save(byte_arr, format='WEBP', quality=quality, method=4)
+    return byte_arr.getvalue()
+
+
+def normalize_image(source: Union[bytes, str], max_edge: int, quality: int, thumbnail_edges: Sequence[int] = ()) -> dict:
+    """
+    Decodes an image once, applies its EXIF orientation, downscales it to max_edge and
+    re-encodes it as WebP, plus one WebP thumbnail per entry in thumbnail_edges.
+    source is raw bytes or a file path. Runs in a worker process; see normalize_image_async.
+    """
+    img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    # Lets the JPEG decoder downscale by up to 8x while decoding, far cheaper than a full decode
+    img.draft('RGB', (max_edge, max_edge))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+
+    img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    thumbnails = {}
+    for edge in sorted(thumbnail_edges, reverse=True):
+        # Each thumbnail is derived from the already-downscaled image, not a new decode
+        thumbnail = img.copy()
+        thumbnail.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        thumbnails[edge] = _encode_webp(thumbnail, quality)
+
+    return {
+        "image": _encode_webp(img, quality),
+        "content_type": WEBP_CONTENT_TYPE,
+        "width": img.width,
+        "height": img.height,
+        "thumbnails": thumbnails,
+    }
+
+
+async def normalize_image_async(source: Union[bytes, str], max_edge: int, quality: int, thumbnail_edges: Sequence[int] = ()) -> dict:
+    """Runs normalize_image in the process pool, keeping Pillow off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(start_process_pool(), normalize_image, source, max_edge, quality, tuple(thumbnail_edges))
+
+
+def start_process_pool() -> ProcessPoolExecutor:
+    """
+    Creates the worker pool (the app does this at startup). Workers are spawned, not
+    forked: forking a process that already runs gRPC channels and listener threads
+    can deadlock or crash the children.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
@@ -0,0 +1,67 @@
+import threading
+from collections import defaultdict, deque
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry: counters, gauges and timing summaries.
+    Exposed as JSON on GET /metrics. Safe to call from executor threads.
+    """
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._window = window
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._samples = {}
+        self._totals = defaultdict(lambda: [0, 0.0])  # name -> [count, sum]
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def add_gauge(self, name: str, delta: float):
+        with self._lock:
+            self._gauges[name] = self._gauges.get(name, 0) + delta
+
+    def observe(self, name: str, value: float):
+        """Records one sample, e.g. a latency in milliseconds. Percentiles cover the most recent samples."""
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self._window)
+            self._samples[name].append(value)
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += value
+
+    @staticmethod
+    def _percentile(sorted_values, q: float) -> float:
+        index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+        return sorted_values[index]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            summaries = {}
+            for name, samples in self._samples.items():
+                values = sorted(samples)
+                count, total = self._totals[name]
+                summaries[name] = {
+                    "count": count,
+                    "mean": total / count if count else 0.0,
+                    "p50": self._percentile(values, 0.50),
+                    "p99": self._percentile(values, 0.99),
+                    "max": values[-1],
+                }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": summaries,
+            }
+
+
+# Singleton registry shared by the whole app
+metrics = Metrics()
@@ -0,0 +1,58 @@
+import math
+from typing import Dict, Iterable
+
+# Log-spaced histogram used as a mergeable quantile sketch for category prices.
+# Bucket i covers [SKETCH_MIN_PRICE * GROWTH**(i-1), SKETCH_MIN_PRICE * GROWTH**i), so any
+# percentile read from it is within ~5% of the true value. Bucket 0 holds everything
+# at or below the minimum price, the last bucket everything above the maximum.
+SKETCH_MIN_PRICE = 10.0
+SKETCH_MAX_PRICE = 10_000_000.0
+SKETCH_GROWTH = 1.1
+SKETCH_NUM_BUCKETS = math.ceil(math.log(SKETCH_MAX_PRICE / SKETCH_MIN_PRICE, SKETCH_GROWTH)) + 2
+
+
+def round_to_nearest(n: float, step: float = 5) -> float:
+    """Rounds to a cleaner number, e.g. prices to the nearest ₹5 or hours to the nearest half hour."""
+    return step * round(n / step)
+
+
+def price_bucket(price: float) -> int:
+    if price <= SKETCH_MIN_PRICE:
+        return 0
+    bucket = math.floor(math.log(price / SKETCH_MIN_PRICE, SKETCH_GROWTH)) + 1
+    return min(bucket, SKETCH_NUM_BUCKETS - 1)
+
+
+def bucket_value(bucket: int) -> float:
+    """Representative price of a bucket: the geometric midpoint of its bounds."""
+    if bucket <= 0:
+        return SKETCH_MIN_PRICE
+    return SKETCH_MIN_PRICE * SKETCH_GROWTH ** (bucket - 0.5)
+
+
+def build_sketch(prices: Iterable[float]) -> Dict[str, int]:
+    """Histogram of prices keyed by bucket number as a string (Firestore map keys must be strings)."""
+    sketch: Dict[str, int] = {}
+    for price in prices:
+        key = str(price_bucket(price))
+        sketch[key] = sketch.get(key, 0) + 1
+    return sketch
+
+
+def sketch_percentiles(sketch: Dict[str, int], quantiles=(0.25, 0.5, 0.75)) -> Dict[str, float]:
+    """Approximate percentiles, e.g. {"p25": ..., "p50": ..., "p75": ...}. Empty when the sketch is."""
+    buckets = sorted((int(bucket), count) for bucket, count in sketch.items() if count > 0)
+    total = sum(count for _, count in buckets)
+    if not total:
+        return {}
+
+    percentiles = {}
+    for q in quantiles:
+        rank = q * total
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen >= rank:
+                percentiles[f"p{round(q * 100)}"] = bucket_value(bucket)
+                break
+    return percentiles
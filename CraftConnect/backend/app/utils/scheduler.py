@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class QuotaExceeded(Exception):
+    """Raised instead of queueing when a call could not start within its time budget."""
+
+    def __init__(self, model: str, retry_after_s: float):
+        super().__init__(f"{model} is over capacity; retry in {retry_after_s:.1f}s.")
+        self.model = model
+        self.retry_after_s = retry_after_s
+
+
+# Set per request or job with `scheduling(...)`; inherited by tasks it creates
+_priority: ContextVar[Priority] = ContextVar("scheduler_priority", default=Priority.INTERACTIVE)
+_budget_s: ContextVar[Optional[float]] = ContextVar("scheduler_budget_s", default=None)
+# Set inside work shared by several callers (micro-batches, single-flight tasks): their claims
+_claims: ContextVar[Optional[List[Tuple[Priority, Optional[float]]]]] = ContextVar("scheduler_claims", default=None)
+
+
+@contextmanager
+def scheduling(priority: Priority, budget_s: Optional[float] = None):
+    """
+    Runs the enclosed work at the given priority. budget_s is how long a call may wait
+    for capacity before QuotaExceeded; None means the default for the priority
+    (SCHEDULER_INTERACTIVE_BUDGET_S for interactive work, unbounded for batch jobs).
+    """
+    priority_token = _priority.set(priority)
+    budget_token = _budget_s.set(budget_s)
+    claims_token = _claims.set(None)
+    try:
+        yield
+    finally:
+        _priority.reset(priority_token)
+        _budget_s.reset(budget_token)
+        _claims.reset(claims_token)
+
+
+@contextmanager
+def scheduling_for(claims: List[Tuple[Priority, Optional[float]]]):
+    """
+    Runs work shared by several callers on behalf of all of them: each backend call is
+    admitted at the most urgent claimed priority and by the earliest claimed deadline.
+    claims holds current_claim() of each caller and may grow while the work runs.
+    """
+    claims_token = _claims.set(claims)
+    try:
+        yield
+    finally:
+        _claims.reset(claims_token)
+
+
+def _current_budget(priority: Priority) -> Optional[float]:
+    budget_s = _budget_s.get()
+    if budget_s is None and priority == Priority.INTERACTIVE:
+        return settings.SCHEDULER_INTERACTIVE_BUDGET_S
+    return budget_s
+
+
+def current_claim() -> Tuple[Priority, Optional[float]]:
+    """
+    The calling context's (priority, absolute time.monotonic() deadline or None). Capture it
+    where a caller hands work to a shared task, since that task runs in someone else's context.
+    """
+    claims = _claims.get()
+    if claims:
+        deadlines = [deadline for _, deadline in claims if deadline is not None]
+        return min(priority for priority, _ in claims), min(deadlines, default=None)
+    priority = _priority.get()
+    budget_s = _current_budget(priority)
+    return priority, None if budget_s is None else time.monotonic() + budget_s
+
+
+class _Waiter:
+    __slots__ = ("priority", "deadline", "seq", "cost", "future")
+
+    def __init__(self, priority: Priority, deadline: Optional[float], seq: int, cost: float, future: asyncio.Future):
+        self.priority = priority
+        self.deadline = deadline
+        self.seq = seq
+        self.cost = cost
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        # Interactive before batch, then earliest deadline, then arrival order
+        return (self.priority, self.deadline or float("inf"), self.seq) < (
+            other.priority, other.deadline or float("inf"), other.seq
+        )
+
+
+class ModelScheduler:
+    """
+    Admission control for one backend model or API: a token bucket (rate_per_s, burst)
+    plus a concurrency limit, shared by every caller in the process. Waiting calls are
+    served by priority and deadline. A call whose estimated wait exceeds its budget is
+    rejected immediately with QuotaExceeded instead of piling up, and a 429 from the
+    backend pauses the bucket so queued calls do not make it worse.
+    """
+
+    def __init__(self, name: str, rate_per_s: float, burst: float, max_concurrency: int):
+        self.name = name
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._service_s = 1.0  # moving average of how long an admitted call holds its slot
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+
+    def _wake_later(self, delay_s: float):
+        if self._timer is None:
+            def wake():
+                self._timer = None
+                self._pump()
+            self._timer = asyncio.get_running_loop().call_later(delay_s, wake)
+
+    def _pump(self):
+        """Grants capacity to waiting calls in priority order while tokens and slots allow."""
+        now = time.monotonic()
+        self._refill(now)
+        while self._queue:
+            head = self._queue[0]
+            if head.future.done():  # timed out or cancelled
+                heapq.heappop(self._queue)
+                continue
+            if self._in_flight >= self.max_concurrency:
+                break  # a release will pump again
+            if now < self._paused_until:
+                self._wake_later(self._paused_until - now)
+                break
+            if self._tokens < head.cost:
+                self._wake_later((head.cost - self._tokens) / self.rate_per_s)
+                break
+            heapq.heappop(self._queue)
+            self._tokens -= head.cost
+            self._in_flight += 1
+            head.future.set_result(None)
+        metrics.set_gauge(f"scheduler.{self.name}.queue_depth", sum(not w.future.done() for w in self._queue))
+        metrics.set_gauge(f"scheduler.{self.name}.in_flight", self._in_flight)
+
+    def estimated_wait_s(self, priority: Priority, cost: float = 1) -> float:
+        """Rough time until a new call at this priority would be admitted."""
+        now = time.monotonic()
+        self._refill(now)
+        ahead = [w for w in self._queue if not w.future.done() and w.priority <= priority]
+        needed = sum(w.cost for w in ahead) + cost - self._tokens
+        wait_s = max(0.0, needed / self.rate_per_s) + max(0.0, self._paused_until - now)
+        if self._in_flight >= self.max_concurrency:
+            # Every call ahead needs a slot too: roughly one service time per round of slots
+            rounds = math.ceil((len(ahead) + 1) / self.max_concurrency)
+            wait_s = max(wait_s, rounds * self._service_s)
+        return wait_s
+
+    def throttled(self):
+        """The backend returned 429: stop admitting calls for a while and drain the bucket."""
+        self._paused_until = max(self._paused_until, time.monotonic() + settings.SCHEDULER_THROTTLE_PAUSE_S)
+        self._tokens = 0.0
+        metrics.incr(f"scheduler.{self.name}.throttled")
+
+    def _release(self):
+        self._in_flight -= 1
+        self._pump()
+
+    async def _acquire(self, cost: float):
+        priority, deadline = current_claim()
+        started = time.monotonic()
+        budget_s = None if deadline is None else max(0.0, deadline - started)
+        if budget_s is not None:
+            estimate = self.estimated_wait_s(priority, cost)
+            if estimate > budget_s:
+                metrics.incr(f"scheduler.{self.name}.rejected")
+                raise QuotaExceeded(self.name, estimate)
+
+        waiter = _Waiter(priority, deadline, next(self._seq), cost, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        self._pump()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), budget_s)
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                waiter.future.cancel()
+                metrics.incr(f"scheduler.{self.name}.expired")
+                raise QuotaExceeded(self.name, self.estimated_wait_s(priority, cost))
+        except BaseException:
+            # Cancelled while waiting: hand back capacity if it was granted meanwhile
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release()
+            else:
+                waiter.future.cancel()
+            raise
+        metrics.observe(f"scheduler.{self.name}.wait_ms", (time.monotonic() - started) * 1000)
+
+    @asynccontextmanager
+    async def slot(self, cost: float = 1):
+        """Holds one admitted call (cost tokens, one concurrency slot) for the enclosed block."""
+        await self._acquire(cost)
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if getattr(e, "code", None) == 429:
+                self.throttled()
+            raise
+        finally:
+            self._service_s = 0.9 * self._service_s + 0.1 * (time.monotonic() - started)
+            self._release()
+
+
+def _model_scheduler(name: str, prefix: str) -> ModelScheduler:
+    return ModelScheduler(
+        name,
+        rate_per_s=getattr(settings, f"{prefix}_RPS"),
+        burst=getattr(settings, f"{prefix}_BURST"),
+        max_concurrency=getattr(settings, f"{prefix}_CONCURRENCY"),
+    )
+
+
+# One scheduler per backend, shared by every module that calls it
+schedulers: Dict[str, ModelScheduler] = {
+    "gemini": _model_scheduler("gemini", "QUOTA_GEMINI"),
+    "embeddings": _model_scheduler("embeddings", "QUOTA_EMBEDDINGS"),
+    "translation": _model_scheduler("translation", "QUOTA_TRANSLATION"),
+    "vision": _model_scheduler("vision", "QUOTA_VISION"),
+}
+
+
+def slot(model: str, cost: float = 1):
+    """`async with slot("gemini"):` around a single backend call."""
+    return schedulers[model].slot(cost)
@@ -0,0 +1,26 @@
+import json
+import logging
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def ndjson_response(events: AsyncIterator[dict]) -> StreamingResponse:
+    """
+    Streams dict events as newline-delimited JSON. The status code is already sent when
+    the body starts, so a failure mid-stream is reported as a final {"event": "error"} line.
+    """
+    async def body():
+        try:
+            async for event in events:
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Stream failed: {e}", exc_info=True)
+            yield json.dumps({"event": "error", "detail": str(e)}) + "\n"
+
+    # Disable proxy buffering so each line reaches the client as soon as it is produced
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE, headers={"X-Accel-Buffering": "no"})
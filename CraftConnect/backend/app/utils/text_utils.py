@@ -0,0 +1,74 @@
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Dict, Optional
+
+from app.utils.cache import LRUCache
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, trimmed, internal whitespace collapsed."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of the normalised text, so whitespace-only edits map to the same key."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def glossary_version(glossary: Dict[str, str]) -> str:
+    """Content hash of a glossary; any edit to a term or its translation changes it."""
+    return hashlib.sha256(json.dumps(glossary, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _trie_pattern(node: dict) -> str:
+    """
+    Regex for a character trie. Shared prefixes are matched once, and every optional
+    ending is greedy, so longer terms win over their prefixes.
+    """
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        body = f"(?:{body})?"
+    return body
+
+
+class GlossaryMatcher:
+    """
+    A whole glossary compiled into one case-insensitive regex, so substitution is a single
+    pass over the text instead of one re.sub per term. Overlapping terms resolve to the
+    longest match; replacements are inserted literally.
+    """
+
+    def __init__(self, glossary: Dict[str, str]):
+        self._replacements = {term.lower(): translation for term, translation in glossary.items() if term}
+        trie: dict = {}
+        for term in self._replacements:
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        self._pattern = re.compile(rf"\b{_trie_pattern(trie)}\b", flags=re.IGNORECASE) if trie else None
+
+    def apply(self, text: str) -> str:
+        if self._pattern is None:
+            return text
+        return self._pattern.sub(lambda match: self._replacements.get(match.group(0).lower(), match.group(0)), text)
+
+
+_matchers = LRUCache(max_size=512, name="glossary_matchers")
+
+
+def compile_glossary(glossary: Dict[str, str], version: Optional[str] = None) -> GlossaryMatcher:
+    """Compiled matcher for a glossary, cached by its version (a content hash unless one is given)."""
+    version = version or glossary_version(glossary)
+    matcher = _matchers.get(version)
+    if matcher is None:
+        matcher = GlossaryMatcher(glossary)
+        _matchers.set(version, matcher)
+    return matcher
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from typing import BinaryIO, Optional
+
+import psutil
+from fastapi import UploadFile
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Portable (unlike the Unix-only resource module); peak RSS is tracked across observations
+_process = psutil.Process()
+_max_rss_kb = 0
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class SpooledUpload:
+    """
+    An upload read in fixed-size chunks and hashed as it arrives. Small files stay in
+    memory; once the size passes the spool threshold the bytes move to a temporary file,
+    so a request never holds more than spool_threshold + one chunk in memory.
+    """
+
+    def __init__(self, spool_threshold: int, content_type: Optional[str] = None):
+        self.spool_threshold = spool_threshold
+        self.content_type = content_type
+        self.size = 0
+        self.path: Optional[str] = None  # set once spooled to disk
+        self._hasher = hashlib.sha256()
+        self._file: BinaryIO = io.BytesIO()
+        self._closed = False
+        metrics.add_gauge("uploads.in_flight", 1)
+
+    @property
+    def sha256(self) -> str:
+        return self._hasher.hexdigest()
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    def _roll_to_disk(self):
+        fd, self.path = tempfile.mkstemp(prefix="upload-")
+        disk_file = os.fdopen(fd, "w+b")
+        disk_file.write(self._file.getbuffer())
+        metrics.add_gauge("uploads.memory_bytes", -self.size)
+        metrics.incr("uploads.spooled_to_disk")
+        self._file = disk_file
+
+    def _write(self, chunk: bytes):
+        if self.in_memory and self.size + len(chunk) > self.spool_threshold:
+            self._roll_to_disk()
+        self._file.write(chunk)
+        if self.in_memory:
+            metrics.add_gauge("uploads.memory_bytes", len(chunk))
+        self.size += len(chunk)
+
+    async def write(self, chunk: bytes):
+        self._hasher.update(chunk)
+        if self.in_memory and self.size + len(chunk) <= self.spool_threshold:
+            self._write(chunk)
+        else:
+            # Disk writes go to the thread pool
+            await asyncio.get_running_loop().run_in_executor(None, self._write, chunk)
+
+    def open(self) -> BinaryIO:
+        """The spooled bytes, rewound to the start."""
+        self._file.seek(0)
+        return self._file
+
+    def read_bytes(self) -> bytes:
+        return self.open().read()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.in_memory:
+            metrics.add_gauge("uploads.memory_bytes", -self.size)
+        self._file.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.warning(f"Could not remove spooled upload {self.path}: {e}")
+        metrics.add_gauge("uploads.in_flight", -1)
+        _record_rss()
+
+
+def _record_rss():
+    global _max_rss_kb
+    rss_kb = _process.memory_info().rss // 1024
+    _max_rss_kb = max(_max_rss_kb, rss_kb)
+    metrics.set_gauge("process.rss_kb", rss_kb)
+    metrics.set_gauge("process.max_rss_kb", _max_rss_kb)
+
+
+async def spool_upload(upload: UploadFile, max_bytes: int, chunk_size: int, spool_threshold: int) -> SpooledUpload:
+    """
+    Reads an UploadFile chunk by chunk into a SpooledUpload, hashing incrementally.
+    Raises UploadTooLarge as soon as more than max_bytes have been read.
+    """
+    spooled = SpooledUpload(spool_threshold, content_type=upload.content_type)
+    try:
+        while chunk := await upload.read(chunk_size):
+            if spooled.size + len(chunk) > max_bytes:
+                metrics.incr("uploads.rejected_too_large")
+                raise UploadTooLarge(f"Upload exceeds the limit of {max_bytes} bytes.")
+            await spooled.write(chunk)
+    except BaseException:
+        spooled.close()
+        raise
+
+    metrics.observe("uploads.size_bytes", spooled.size)
+    return spooled
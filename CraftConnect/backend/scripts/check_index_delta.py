@@ -0,0 +1,59 @@
+import os
+import sys
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+from app.utils.faiss_utils import (
+    apply_delta, build_index, compute_neighbor_table, set_search_params, update_neighbor_table,
+)
+
+# Self-contained (synthetic vectors, no settings or published index): exits non-zero on failure.
+# Run from the backend directory: python scripts/check_index_delta.py
+
+
+def check_delta(index_type: str, num_vectors: int = 400, dimension: int = 16):
+    """Build, remove one label, add one label, then every live vector must find its own label."""
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((num_vectors + 1, dimension)).astype("float32")
+    labels = np.arange(num_vectors, dtype="int64")
+
+    index, meta = build_index(vectors[:num_vectors], labels=labels, index_type=index_type, metric="cosine", nlist=4)
+    removed, added = 7, num_vectors
+    apply_delta(index, "cosine", [removed], vectors[added:], [added])
+    set_search_params(index, nprobe=4)  # probe every list so the check is exact
+
+    live = np.array([label for label in range(num_vectors + 1) if label != removed])
+    _, found = index.search(np.ascontiguousarray(vectors[live] / np.linalg.norm(vectors[live], axis=1, keepdims=True)), 1)
+    assert index.ntotal == num_vectors, f"{index_type}: expected {num_vectors} vectors, got {index.ntotal}"
+    assert (found[:, 0] == live).all(), f"{index_type}: search returned the wrong labels after a delta"
+    assert removed not in found, f"{index_type}: removed label {removed} is still returned"
+    print(f"✅ Delta check passed for {meta['factory']}")
+
+
+def check_neighbor_update(metric: str, num_vectors: int = 1000, dimension: int = 16, k: int = 10):
+    """After an update/delete/add delta, the incremental neighbour table must equal a full recompute."""
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((num_vectors + 3, dimension)).astype("float32")
+    index, _ = build_index(vectors[:num_vectors], index_type="flat", metric=metric)
+    neighbors, distances = compute_neighbor_table(index, vectors[:num_vectors], range(num_vectors), metric, k)
+
+    updated, deleted, added = [1, 2], [10, 11], [num_vectors, num_vectors + 1, num_vectors + 2]
+    vectors[updated] = rng.standard_normal((len(updated), dimension))
+    vectors[deleted] = 0
+    changed, stale = updated + added, updated + deleted
+    apply_delta(index, metric, stale, vectors[changed], changed)
+
+    live = sorted(set(range(len(vectors))) - set(deleted))
+    full = compute_neighbor_table(index, vectors, live, metric, k)
+    incremental = update_neighbor_table(index, vectors, live, metric, k, neighbors, distances, changed, stale)
+    assert (full[0] == incremental[0]).all(), f"{metric}: incremental neighbour table differs from a full recompute"
+    print(f"✅ Neighbour table update check passed for {metric}")
+
+
+if __name__ == "__main__":
+    # Incremental runs remove and re-add labels in place; both index layouts must keep labels intact
+    for index_type in ("flat", "ivf_flat"):
+        check_delta(index_type)
+    for metric in ("cosine", "l2"):
+        check_neighbor_update(metric)
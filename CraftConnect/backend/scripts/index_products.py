@@ -1,7 +1,8 @@
+import argparse
 import asyncio
 import faiss
+import hashlib
 import numpy as np
-import pickle
 import logging
 
 # This setup allows the script to import from our 'app' module
@@ -11,63 +12,261 @@ sys.path.append(os.getcwd())
 
 from app.config.settings import settings
 from app.models.embeddings import embedding_client
+from app.utils.scheduler import Priority, scheduling
 from app.cloud_services.firestore_db import db
+from app.utils.faiss_utils import (
+    INDEX_FILE, META_FILE, MANIFEST_FILE, VECTORS_FILE, NEIGHBORS_FILE, NEIGHBOR_DISTANCES_FILE,
+    apply_delta, build_index, compute_neighbor_table, current_version, load_array, new_version_dir, prune_versions,
+    publish_version, read_manifest, read_meta, set_search_params, supports_removal, write_ids,
+    update_neighbor_table, write_manifest, write_meta, write_neighbor_table, write_vectors,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def main():
+# Firestore rejects write batches with more than 500 operations
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def content_hash(text: str) -> str:
+    """Changes whenever the embedded text or the embedding model changes."""
+    return hashlib.sha256(f"{settings.EMBEDDING_MODEL_ID}\n{text}".encode("utf-8")).hexdigest()
+
+
+async def load_catalogue() -> dict:
+    """Returns {product_id: text to embed}, streaming only the fields the index needs."""
+    products_ref = db.collection('products').select(['description', 'name'])
+    catalogue = {}
+    async for doc in products_ref.stream():
+        data = doc.to_dict()
+        # Use description, fall back to name, then empty string
+        catalogue[doc.id] = data.get('description') or data.get('name', '')
+    return catalogue
+
+
+async def embed_and_save(product_ids: list, texts: list) -> np.ndarray:
+    """Embeds the given texts and saves them back to Firestore for individual lookups."""
+    logger.info(f"Generating embeddings for {len(texts)} products...")
+    embeddings = await embedding_client.get_embeddings(texts)
+
+    for start in range(0, len(product_ids), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for i in range(start, min(start + FIRESTORE_BATCH_LIMIT, len(product_ids))):
+            product_ref = db.collection('products').document(product_ids[i])
+            batch.update(product_ref, {"description_embedding": embeddings[i]})
+        await batch.commit()
+    logger.info("Embeddings saved back to Firestore documents.")
+
+    return np.array(embeddings).astype('float32')
+
+
+def build_from_scratch(embedding_matrix: np.ndarray, labels=None):
+    # Type and metric come from settings
+    return build_index(
+        embedding_matrix,
+        labels=labels,
+        index_type=settings.FAISS_INDEX_TYPE,
+        metric=settings.FAISS_METRIC,
+        nlist=settings.FAISS_NLIST,
+        pq_m=settings.FAISS_PQ_M,
+        pq_nbits=settings.FAISS_PQ_NBITS,
+        hnsw_m=settings.FAISS_HNSW_M,
+        hnsw_ef_construction=settings.FAISS_HNSW_EF_CONSTRUCTION,
+    )
+
+
+def load_previous_version():
+    """
+    Returns (index, meta, manifest, vectors, neighbour table) of the live version if it can be
+    updated incrementally, else None. The neighbour table is (neighbors, distances), or None
+    when the version has none or it was built for a different NEIGHBOR_TABLE_K.
+    """
+    version = current_version(settings.FAISS_INDEX_DIR)
+    if version is None:
+        logger.info("No published index yet.")
+        return None
+
+    version_dir = os.path.join(settings.FAISS_INDEX_DIR, version)
+    meta = read_meta(os.path.join(version_dir, META_FILE))
+    manifest = read_manifest(os.path.join(version_dir, MANIFEST_FILE))
+    if manifest is None or not meta.get("id_mapped"):
+        logger.info(f"Version {version} has no manifest.")
+        return None
+    if meta.get("factory", "").startswith("IVF") and not meta.get("native_ids"):
+        # Older IVF versions were wrapped in an IndexIDMap2, whose mapping breaks on removal
+        logger.info(f"Version {version} is an ID-mapped IVF index and cannot be updated in place.")
+        return None
+    if (meta.get("index_type"), meta.get("metric")) != (settings.FAISS_INDEX_TYPE, settings.FAISS_METRIC):
+        logger.info(f"Version {version} was built as {meta.get('index_type')}/{meta.get('metric')}; settings changed.")
+        return None
+
+    vectors = load_array(os.path.join(version_dir, VECTORS_FILE), mmap=True)
+    if vectors is None:
+        logger.info(f"Version {version} has no vector store.")
+        return None
+
+    neighbors = load_array(os.path.join(version_dir, NEIGHBORS_FILE), mmap=True)
+    distances = load_array(os.path.join(version_dir, NEIGHBOR_DISTANCES_FILE), mmap=True)
+    neighbor_table = None
+    if neighbors is not None and distances is not None and neighbors.shape[1] == settings.NEIGHBOR_TABLE_K:
+        neighbor_table = (neighbors, distances)
+
+    # Loaded fully into memory: a memory-mapped index is read-only
+    index = faiss.read_index(os.path.join(version_dir, INDEX_FILE))
+    return index, meta, manifest, vectors, neighbor_table
+
+
+def publish(index, meta: dict, manifest: dict, vectors: np.ndarray, neighbor_delta: tuple = None):
+    """
+    Writes the index, its metadata, the label -> product_id table, the vector store and the
+    manifest into a new version directory, then publishes it. Running API workers hot-swap
+    to it on their next poll.
+
+    neighbor_delta is (previous neighbors, previous distances, changed labels, stale labels)
+    on incremental runs: only the neighbour-table rows the delta can affect are re-searched.
+    """
+    product_ids = [""] * manifest["next_label"]
+    for product_id, (label, _) in manifest["products"].items():
+        product_ids[label] = product_id
+    meta["ntotal"] = int(index.ntotal)
+
+    os.makedirs(settings.FAISS_INDEX_DIR, exist_ok=True)
+    version_dir = new_version_dir(settings.FAISS_INDEX_DIR)
+    faiss.write_index(index, os.path.join(version_dir, INDEX_FILE))
+    write_ids(product_ids, version_dir)
+    write_vectors(vectors, version_dir)
+
+    if settings.NEIGHBOR_TABLE_K > 0:
+        # Offline stage: precompute every product's neighbours so most requests skip the live search
+        set_search_params(index, nprobe=settings.FAISS_NPROBE, ef_search=settings.FAISS_EF_SEARCH)
+        live_labels = sorted(label for label, _ in manifest["products"].values())
+        if neighbor_delta is not None:
+            previous_neighbors, previous_distances, changed_labels, stale_labels = neighbor_delta
+            neighbors, distances = update_neighbor_table(
+                index, vectors, live_labels, meta["metric"], settings.NEIGHBOR_TABLE_K,
+                previous_neighbors, previous_distances, changed_labels, stale_labels,
+                batch_size=settings.NEIGHBOR_TABLE_BATCH,
+            )
+        else:
+            neighbors, distances = compute_neighbor_table(
+                index, vectors, live_labels, meta["metric"],
+                k=settings.NEIGHBOR_TABLE_K, batch_size=settings.NEIGHBOR_TABLE_BATCH,
+            )
+        write_neighbor_table(neighbors, distances, version_dir)
+    write_meta(meta, os.path.join(version_dir, META_FILE))
+    write_manifest(manifest, os.path.join(version_dir, MANIFEST_FILE))
+    publish_version(settings.FAISS_INDEX_DIR, version_dir)
+    prune_versions(settings.FAISS_INDEX_DIR, keep=settings.FAISS_KEEP_VERSIONS)
+
+    logger.info(f"FAISS index version '{os.path.basename(version_dir)}' published to '{settings.FAISS_INDEX_DIR}'.")
+
+
+async def full_index(catalogue: dict):
+    product_ids = list(catalogue)
+    texts = [catalogue[pid] for pid in product_ids]
+    embedding_matrix = await embed_and_save(product_ids, texts)
+
+    index, meta = build_from_scratch(embedding_matrix)
+    manifest = {
+        "next_label": len(product_ids),
+        "products": {pid: [label, content_hash(text)] for label, (pid, text) in enumerate(zip(product_ids, texts))},
+    }
+    publish(index, meta, manifest, embedding_matrix)
+
+
+async def incremental_index(catalogue: dict, previous) -> None:
+    index, meta, manifest, previous_vectors, neighbor_table = previous
+    known = manifest["products"]
+
+    hashes = {pid: content_hash(text) for pid, text in catalogue.items()}
+    added = [pid for pid in catalogue if pid not in known]
+    updated = [pid for pid in catalogue if pid in known and known[pid][1] != hashes[pid]]
+    deleted = [pid for pid in known if pid not in catalogue]
+    logger.info(f"Delta: {len(added)} added, {len(updated)} updated, {len(deleted)} deleted.")
+
+    if not (added or updated or deleted):
+        logger.info("Catalogue unchanged. Keeping the live index version.")
+        return
+
+    changed = added + updated
+    embedding_matrix = await embed_and_save(changed, [catalogue[pid] for pid in changed])
+
+    # Updated products keep their label, new ones get fresh labels
+    next_label = manifest["next_label"]
+    for pid in added:
+        known[pid] = [next_label, None]
+        next_label += 1
+    changed_labels = [known[pid][0] for pid in changed]
+    deleted_labels = [known[pid][0] for pid in deleted]
+    stale_labels = [known[pid][0] for pid in updated] + deleted_labels
+
+    # Carry the vector store forward: copy the old rows, overwrite changed ones, blank deleted ones
+    vectors = np.zeros((next_label, previous_vectors.shape[1]), dtype="float32")
+    vectors[:len(previous_vectors)] = previous_vectors
+    vectors[deleted_labels] = 0
+    if changed:
+        vectors[changed_labels] = embedding_matrix
+
+    for pid in changed:
+        known[pid][1] = hashes[pid]
+    for pid in deleted:
+        del known[pid]
+    manifest["next_label"] = next_label
+
+    if stale_labels and not supports_removal(index):
+        # HNSW cannot delete: rebuild it from the vector store without re-embedding anything
+        logger.info("Index type does not support removals. Rebuilding it from the stored vectors.")
+        live_labels = np.array(sorted(label for label, _ in known.values()), dtype="int64")
+        index, meta = build_from_scratch(vectors[live_labels], labels=live_labels)
+    else:
+        apply_delta(index, meta["metric"], stale_labels, embedding_matrix, changed_labels)
+
+    neighbor_delta = None
+    if neighbor_table is not None:
+        neighbor_delta = (*neighbor_table, changed_labels, stale_labels)
+    publish(index, meta, manifest, vectors, neighbor_delta)
+
+
+async def main(incremental: bool = False):
     """
     Fetches all products, generates embeddings, saves them to Firestore,
     and creates a FAISS index for local similarity search.
+
+    With incremental=True only new or changed descriptions are embedded and
+    applied to the live index; deleted products are removed from it.
     """
     logger.info("Starting product indexing...")
-    products_ref = db.collection('products')
-    all_products = [doc async for doc in products_ref.stream()]
+    catalogue = await load_catalogue()
 
-    if not all_products:
+    if not catalogue:
         logger.warning("No products found in Firestore. Exiting.")
         return
+    logger.info(f"Found {len(catalogue)} products.")
 
-    product_ids = [p.id for p in all_products]
-    # Use description, fall back to name, then empty string
-    descriptions = [
-        p.to_dict().get('description') or p.to_dict().get('name', '') 
-        for p in all_products
-    ]
-    
-    logger.info(f"Found {len(descriptions)} products. Generating embeddings...")
-    embeddings = []
-    for desc in descriptions:
-        embedding = await embedding_client.get_embedding(desc)
-        embeddings.append(embedding)
-    
-    # Save embeddings back to Firestore for individual lookups
-    batch = db.batch()
-    for i, product_id in enumerate(product_ids):
-        product_ref = db.collection('products').document(product_id)
-        batch.update(product_ref, {"description_embedding": embeddings[i]})
-    await batch.commit()
-    logger.info("Embeddings saved back to Firestore documents.")
+    previous = load_previous_version() if incremental else None
+    if incremental and previous is None:
+        logger.info("Falling back to a full rebuild.")
+
+    if previous is None:
+        await full_index(catalogue)
+    else:
+        await incremental_index(catalogue, previous)
 
-    # Create and save FAISS index
-    dimension = len(embeddings[0])
-    index = faiss.IndexFlatL2(dimension)
-    embedding_matrix = np.array(embeddings).astype('float32')
-    index.add(embedding_matrix)
-    
-    # Save the index and the mapping from index position to product_id
-    faiss.write_index(index, "index.faiss")
-    with open("mapping.pkl", "wb") as f:
-        pickle.dump(product_ids, f)
-    
-    logger.info("FAISS index (index.faiss) and mapping file (mapping.pkl) created successfully.")
     logger.info("Indexing complete!")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the FAISS product similarity index.")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Only embed new or changed products and update the live index version in place."
+    )
+    args = parser.parse_args()
+
     import vertexai
     # Initialize Vertex AI SDK specifically for this script
     vertexai.init(project=settings.PROJECT_ID, location=settings.REGION)
-    
-    asyncio.run(main())
\ No newline at end of file
+
+    # Offline job: never rejected, always served after interactive traffic
+    with scheduling(Priority.BATCH):
+        asyncio.run(main(incremental=args.incremental))
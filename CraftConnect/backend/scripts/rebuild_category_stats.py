@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# This setup allows the script to import from our 'app' module
+import sys
+import os
+sys.path.append(os.getcwd())
+
+from app.cloud_services.firestore_db import db
+from app.cloud_services.category_stats import STATS_COLLECTION, stats_doc_id, stats_document
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Firestore rejects write batches with more than 500 operations
+FIRESTORE_BATCH_LIMIT = 500
+
+
+async def main():
+    """
+    Periodic job: recomputes the per-category price aggregates used by the pricing
+    service in one pass over the catalogue. Schedule it more often than
+    CATEGORY_STATS_MAX_AGE_S (e.g. hourly via cron or Cloud Scheduler, from the backend
+    directory: `python scripts/rebuild_category_stats.py`); otherwise the first pricing
+    request after an aggregate expires rebuilds that category itself.
+    """
+    logger.info("Rebuilding category price statistics...")
+    prices_by_category = defaultdict(list)
+    async for doc in db.collection('products').select(['category', 'price']).stream():
+        data = doc.to_dict()
+        if data.get('category'):
+            prices_by_category[data['category']].append(data.get('price', 0))
+
+    now = datetime.now(timezone.utc)
+    categories = list(prices_by_category)
+    for start in range(0, len(categories), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for category in categories[start:start + FIRESTORE_BATCH_LIMIT]:
+            batch.set(
+                db.collection(STATS_COLLECTION).document(stats_doc_id(category)),
+                stats_document(category, prices_by_category[category], now),
+            )
+        await batch.commit()
+
+    logger.info(f"Rebuilt statistics for {len(categories)} categories.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
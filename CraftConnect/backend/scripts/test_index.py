@@ -1,14 +1,26 @@
-import faiss
-import pickle
+import os
+import sys
+sys.path.append(os.getcwd())
+
+from app.config.settings import settings
+from app.utils.faiss_utils import (
+    INDEX_FILE, IDS_FILE, META_FILE, current_version, load_ids, read_index, read_meta,
+)
+
 
 try:
-    index = faiss.read_index("index.faiss")
-    with open("mapping.pkl", "rb") as f:
-        mapping = pickle.load(f)
+    version = current_version(settings.FAISS_INDEX_DIR)
+    if version is None:
+        raise FileNotFoundError(f"No published index in '{settings.FAISS_INDEX_DIR}'")
+    version_dir = os.path.join(settings.FAISS_INDEX_DIR, version)
+    meta = read_meta(os.path.join(version_dir, META_FILE))
+    index = read_index(os.path.join(version_dir, INDEX_FILE), factory=meta.get("factory", "Flat"))
+    mapping = load_ids(os.path.join(version_dir, IDS_FILE))
 
     print("✅ Index Test SUCCESSFUL!")
+    print(f"   - Live version: {version}")
     print(f"   - Number of vectors in index: {index.ntotal}")
     print(f"   - Number of IDs in mapping: {len(mapping)}")
 
 except Exception as e:
-    print(f"❌ Index Test FAILED: {e}")
\ No newline at end of file
+    print(f"❌ Index Test FAILED: {e}")